@@ -113,10 +113,11 @@ class TSP_DFJ:
 # print(f"berlin 5_tour: {berlin5_tour}")
 #
 
-berlin52 = import_tsp_instance("berlin52.tsp")
-arcs_used_berlin52 = TSP_DFJ().run(berlin52, ACTIVATE_CALLBACK=True)
-berlin52_tour = create_tour(arcs_used_berlin52)
-print(f"berlin52: {berlin52_tour}")
+if __name__ == '__main__':
+    berlin52 = import_tsp_instance("berlin52.tsp")
+    arcs_used_berlin52 = TSP_DFJ().run(berlin52, ACTIVATE_CALLBACK=True)
+    berlin52_tour = create_tour(arcs_used_berlin52)
+    print(f"berlin52: {berlin52_tour}")
 #
 # berlin52 = import_tsp_instance("berlin52.tsp")
 # arcs_used_berlin52 = TSP_DFJ().run(berlin52, ACTIVATE_CALLBACK=True)
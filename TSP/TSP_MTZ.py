@@ -98,8 +98,9 @@ class TSP:
 # print(f"berlin 5_tour: {berlin5_tour}")
 
 #
-distance_matrix_tsp_225 = import_tsp_instance("tsp225.tsp")
-arcs_used_tsp225 = TSP().run(distance_matrix_tsp_225)
-tsp225_tour = create_tour(arcs_used_tsp225)
-print(f"tsp225: {tsp225_tour}")
+if __name__ == '__main__':
+    distance_matrix_tsp_225 = import_tsp_instance("tsp225.tsp")
+    arcs_used_tsp225 = TSP().run(distance_matrix_tsp_225)
+    tsp225_tour = create_tour(arcs_used_tsp225)
+    print(f"tsp225: {tsp225_tour}")
 
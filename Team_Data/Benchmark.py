@@ -0,0 +1,354 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import networkx as nx
+import geopandas as gpd
+import DataGenerationAndProcessing as data
+import DataGenerationAndProcessingExtended as extendedData
+import FlowGeneration
+import MatrixModel
+import Routing
+import SolverBackend
+import SparseParameters
+import SpatialIndex
+
+# Performance benchmark of the data pipeline and the models on synthetic instances, fully offline. The generator
+# builds deterministic road graphs (street grid or random geometric graph) around Munich's centre with OSMnx-style
+# node coordinates and edge lengths, OD locations on crossings and parking lots near a share of the nodes, so the real
+# pipeline functions run unchanged on them. The size is set by the graph nodes (the upper limit of |K|; K are the path
+# nodes left by the parking filter), the OD-pairs |Q| and the paths per OD-pair |P|.
+# Every stage (routing, parking filter, get_parameters*, create_model, solve) is timed separately with its peak Python
+# memory (tracemalloc: memory of this process only, without pool workers or the solvers' native memory) and its
+# throughput. Results go to JSON. Timings only compare on the same machine, so no baseline is kept in the repository:
+# the regression check is opt-in with --baseline, against a run stored before with --save-baseline on that machine,
+# and flags slower stages, higher memory and worse objectives or gaps.
+#
+#   python Benchmark.py --save-baseline benchmark_baseline.json
+#   python Benchmark.py --baseline benchmark_baseline.json --output benchmark_results.json
+
+# Munich's centre, so flows and metric projections of the synthetic graphs behave as for the real data
+CENTRE = (48.137, 11.575)
+METRES_PER_DEGREE = 111320
+
+# Default suite: base and extended model on growing street grids and one random geometric graph
+SUITE = [
+    {"name": "grid-400-base", "model": "base", "kind": "grid", "nodes": 400, "od_pairs": 6, "budget": 600},
+    {"name": "grid-400-extended", "model": "extended", "kind": "grid", "nodes": 400, "od_pairs": 6, "paths": 3,
+     "budget": 300},
+    {"name": "grid-1600-base", "model": "base", "kind": "grid", "nodes": 1600, "od_pairs": 16, "budget": 4000},
+    {"name": "grid-1600-extended", "model": "extended", "kind": "grid", "nodes": 1600, "od_pairs": 16, "paths": 3,
+     "budget": 2000},
+    {"name": "geometric-1600-extended", "model": "extended", "kind": "geometric", "nodes": 1600, "od_pairs": 16,
+     "paths": 3, "budget": 1200},
+]
+
+
+# ---------------------------------------------------Synthetic instances------------------------------------------------
+
+
+# (lat, lon) of points given in metres east and north of CENTRE
+def to_degrees(east, north):
+    lat = CENTRE[0] + np.asarray(north) / METRES_PER_DEGREE
+    lon = CENTRE[1] + np.asarray(east) / (METRES_PER_DEGREE * np.cos(np.radians(CENTRE[0])))
+    return lat, lon
+
+
+# Road graph with about n_nodes nodes, spacing metres between neighbouring crossings: "grid" (square street grid) or
+# "geometric" (random geometric graph of the same area and mean degree about 6, largest component). Every street is an
+# edge in both directions with its great-circle length stretched by up to 30 %, so shortest paths are unique
+def synthetic_graph(n_nodes, kind="grid", spacing=100, seed=0):
+    rng = np.random.default_rng(seed)
+    side = max(2, int(round(np.sqrt(n_nodes))))
+    if kind == "grid":
+        H = nx.grid_2d_graph(side, side)
+        positions = {node: (node[0] * spacing, node[1] * spacing) for node in H.nodes}
+    elif kind == "geometric":
+        H = nx.random_geometric_graph(n_nodes, np.sqrt(6 / (np.pi * n_nodes)), seed=seed)
+        H = H.subgraph(max(nx.connected_components(H), key=len))
+        positions = {node: (H.nodes[node]['pos'][0] * side * spacing, H.nodes[node]['pos'][1] * side * spacing)
+                     for node in H.nodes}
+    else:
+        raise ValueError(f"Unknown graph kind '{kind}', choose from ['grid', 'geometric']")
+
+    nodes = list(H.nodes)
+    ids = {node: i for i, node in enumerate(nodes)}
+    lats, lons = to_degrees([positions[node][0] for node in nodes], [positions[node][1] for node in nodes])
+    G = nx.MultiDiGraph(crs="EPSG:4326")
+    G.add_nodes_from((i, {'x': float(lon), 'y': float(lat)}) for i, (lat, lon) in enumerate(zip(lats, lons)))
+
+    edges = [(ids[u], ids[v]) for u, v in H.edges]
+    heads, tails = np.array(edges).T
+    lengths = FlowGeneration.haversine_km(lats[heads], lons[heads], lats[tails], lons[tails]) * 1000
+    lengths *= rng.uniform(1.0, 1.3, len(edges))
+    for (u, v), length in zip(edges, lengths.tolist()):
+        G.add_edge(u, v, length=length)
+        G.add_edge(v, u, length=length)
+    return G
+
+
+# n_od OD-pairs between named locations on distinct crossings (nodes with at least min_edges in-/outgoing edges):
+# coords {name: (lat, lon)} and [(origin, destination)]
+def synthetic_od_pairs(G, n_od, min_edges=6, seed=0):
+    rng = np.random.default_rng(seed)
+    n_locations = 2
+    while n_locations * (n_locations - 1) < n_od:
+        n_locations += 1
+    crossings = [node for node, degree in G.degree if degree >= min_edges]
+    if len(crossings) < n_locations:
+        raise ValueError(f"Graph has only {len(crossings)} crossings for {n_locations} OD locations")
+
+    nodes = rng.choice(crossings, n_locations, replace=False).tolist()
+    coords = {f"Location {i}": (G.nodes[node]['y'], G.nodes[node]['x']) for i, node in enumerate(nodes)}
+    pairs = list(itertools.permutations(coords.keys(), 2))
+    return coords, [pairs[i] for i in sorted(rng.choice(len(pairs), n_od, replace=False).tolist())]
+
+
+# Parking lot centroids close to a share of the graph nodes (moved by up to jitter metres), like get_parking_centroids
+def synthetic_parking(G, share=0.3, jitter=50, seed=0):
+    rng = np.random.default_rng(seed)
+    nodes = list(G.nodes)
+    chosen = rng.choice(len(nodes), max(1, int(share * len(nodes))), replace=False)
+    lats = np.array([G.nodes[nodes[i]]['y'] for i in chosen.tolist()])
+    lons = np.array([G.nodes[nodes[i]]['x'] for i in chosen.tolist()])
+    shift_lat, shift_lon = to_degrees(*rng.uniform(-jitter, jitter, (2, len(chosen))))
+    lats, lons = lats + shift_lat - CENTRE[0], lons + shift_lon - CENTRE[1]
+    return gpd.GeoDataFrame(geometry=gpd.points_from_xy(lons, lats), crs="EPSG:4326")
+
+
+class SyntheticInstance:
+
+    def __init__(self, nodes=900, od_pairs=12, paths=3, kind="grid", parking_share=0.3, seed=0):
+        self.paths = paths
+        self.G = synthetic_graph(nodes, kind, seed=seed)
+        self.coords, self.od_pairs = synthetic_od_pairs(self.G, od_pairs, seed=seed)
+        self.anchors = SpatialIndex.nearest_crossings(self.G, self.coords, min_edges=6)
+        self.parking = synthetic_parking(self.G, parking_share, seed=seed)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("nodes", 900), config.get("od_pairs", 12), config.get("paths", 3),
+                   config.get("kind", "grid"), config.get("parking_share", 0.3), config.get("seed", 0))
+
+
+# ---------------------------------------------------Stage timing-------------------------------------------------------
+
+
+class StageTimer:
+
+    def __init__(self, trace_memory=True, quiet=True):
+        self.trace_memory = trace_memory
+        self.quiet = quiet
+        self.stages = {}
+
+    # Runs function(*args) as the named stage (printing suppressed if quiet) and records its time and peak memory
+    def run(self, name, function, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.start()
+        output = contextlib.redirect_stdout(io.StringIO()) if self.quiet else contextlib.nullcontext()
+        start = time.perf_counter()
+        try:
+            with output:
+                result = function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+            if self.trace_memory:
+                tracemalloc.stop()
+        self.stages[name] = {"seconds": seconds, "peak_memory_mb": peak / 2 ** 20}
+        return result
+
+    # Work done by a stage, e.g. count("routing", 12, "od_pairs"), and the throughput per second
+    def count(self, name, items, unit):
+        stage = self.stages[name]
+        stage.update(items=items, unit=unit, throughput=items / max(stage["seconds"], 1e-9))
+
+    @property
+    def total_seconds(self):
+        return sum(stage["seconds"] for stage in self.stages.values())
+
+
+# ---------------------------------------------------Benchmark----------------------------------------------------------
+
+
+def _parameters_base(instance, routes_nodes, routes_length):
+    annual_trips = data.get_flows(instance.coords, routes_length)
+    return data.get_parameters(routes_nodes, instance.G, annual_trips)
+
+
+def _parameters_extended(instance, routesandpath_nodes, routes_length):
+    annual_trips = data.get_flows(instance.coords, routes_length)
+    return extendedData.get_parameters_extended(routesandpath_nodes, annual_trips, routes_length, instance.G)
+
+
+# Runs the pipeline of the base or the extended model on a SyntheticInstance and solves it to mip_gap with Gurobi
+# (Model, with the constraint-by-constraint builder unless use_matrix_api) or HiGHS (MatrixModel.Formulation via
+# SolverBackend).
+# Returns a JSON-ready dict with the instance size, the stages and the solver result
+def run_benchmark(instance, model="extended", solver="highs", FC=21, VC=20, B=1000, CAP=6, M=999999,
+                  min_service=None, time_limit=20, mip_gap=0.01, routing_backend="networkx",
+                  path_algorithm="edge_disjoint", processes=1, use_matrix_api=False, quiet=True):
+    timer = StageTimer(quiet=quiet)
+    G, od_pairs = instance.G, instance.od_pairs
+    is_extended = model == "extended"
+
+    routes_nodes, routes_length = timer.run("routing", Routing.route_od_pairs, G, instance.anchors, od_pairs,
+                                            processes=processes, backend=routing_backend)
+    if is_extended:
+        routes_paths, _ = timer.run("alternative_paths", Routing.alternative_paths, G, instance.anchors, od_pairs,
+                                    k=instance.paths, algorithm=path_algorithm, processes=processes)
+        timer.count("alternative_paths", len(od_pairs), "od_pairs")
+        routesandpath_nodes = [routes_paths[Routing.od_name(origin, destination)] for origin, destination in od_pairs]
+        path_nodes = sum(len(path) for route_paths in routesandpath_nodes for path in route_paths)
+        routesandpath_nodes = timer.run("parking_filter", SpatialIndex.filter_paths_by_parking, G,
+                                        routesandpath_nodes, instance.parking, max_distance=300)
+        timer.count("parking_filter", path_nodes, "path_nodes")
+        if len(routesandpath_nodes) < len(od_pairs):
+            raise ValueError("The parking filter removed every path of an OD-pair, raise parking_share")
+    timer.count("routing", len(od_pairs), "od_pairs")
+
+    if is_extended:
+        Q, P, K, N_qp, f_q, f_qp, d_k = timer.run("get_parameters", _parameters_extended, instance,
+                                                  routesandpath_nodes, routes_length)
+        n_paths = sum(len(N_qp[q]) for q in Q)
+    else:
+        Q, K, N_q, f_q, d_k = timer.run("get_parameters", _parameters_base, instance, routes_nodes, routes_length)
+        n_paths = len(Q)
+    timer.count("get_parameters", n_paths, "paths")
+
+    if solver == "gurobi":
+        import Model
+
+        if is_extended:
+            charging_model = Model.Model(FC, VC, B, CAP, M, Q, K, N_qp, f_qp, d_k, instance.coords, routes_nodes,
+                                         routes_length, G, True, N_qp, f_qp, P, min_service)
+        else:
+            charging_model = Model.Model(FC, VC, B, CAP, M, Q, K, N_q, f_q, d_k, instance.coords, routes_nodes,
+                                         routes_length, G, False, min_service=min_service)
+        gp_model = timer.run("create_model", charging_model.build, use_matrix_api)
+        timer.count("create_model", gp_model.NumNZs, "nonzeros")
+        gp_model.setParam('OutputFlag', 0)
+        gp_model.setParam('TimeLimit', time_limit)
+        gp_model.setParam('MIPGap', mip_gap)
+        timer.run("solve", gp_model.optimize)
+        objective = gp_model.ObjVal if gp_model.SolCount else float('nan')
+        bound = gp_model.ObjBound if gp_model.SolCount else float('nan')
+        gap = gp_model.MIPGap if gp_model.SolCount else float('nan')
+        status = SolverBackend.gurobi_status(gp_model)
+    else:
+        def formulation():
+            if is_extended:
+                params = SparseParameters.SparseParameters.from_paths(N_qp, f_qp, nodes=K, d_k=d_k)
+            else:
+                params = SparseParameters.SparseParameters.from_routes(N_q, f_q, nodes=K, d_k=d_k)
+            return MatrixModel.Formulation(params, FC, VC, B, CAP, M, min_service)
+
+        built = timer.run("create_model", formulation)
+        timer.count("create_model", built.A.nnz, "nonzeros")
+        result = timer.run("solve", SolverBackend.get_backend(solver).solve, built, time_limit,
+                           mip_gap)
+        objective, bound, gap, status = result.objective, result.bound, result.gap, result.status
+    timer.count("solve", n_paths, "paths")
+
+    return {
+        "model": model,
+        "solver": solver,
+        "size": {"graph_nodes": G.number_of_nodes(), "graph_edges": G.number_of_edges(), "K": len(K), "Q": len(Q),
+                 "paths": n_paths},
+        "stages": timer.stages,
+        "total_seconds": timer.total_seconds,
+        "objective": objective,
+        "bound": bound,
+        "gap": gap,
+        "status": status,
+    }
+
+
+# Runs every configuration of the suite (see SUITE; keys of SyntheticInstance.from_config plus name, model and budget)
+def run_suite(suite=SUITE, solver="highs", time_limit=20, mip_gap=0.01, quiet=True):
+    results = []
+    for config in suite:
+        instance = SyntheticInstance.from_config(config)
+        result = run_benchmark(instance, config.get("model", "extended"), solver, B=config.get("budget", 1000),
+                               min_service=config.get("min_service"), time_limit=time_limit, mip_gap=mip_gap,
+                               quiet=quiet)
+        result = {"name": config["name"], "config": config, **result}
+        results.append(result)
+        stages = ", ".join(f"{name} {round(stage['seconds'], 3)} s" for name, stage in result["stages"].items())
+        print(f"{config['name']}: K={result['size']['K']}, Q={result['size']['Q']}, paths={result['size']['paths']}, "
+              f"objective {round(result['objective'], 4)}, gap {result['gap']:.2e} ({stages})")
+    return results
+
+
+def save_results(results, path):
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "machine": platform.machine(), "processor_count": os.cpu_count(), "results": results}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+# Regressions of results against a baseline run of the same suite: stages more than time_tolerance slower (and at
+# least min_seconds, below that it is timer noise), more than memory_tolerance above the baseline peak (and at least
+# min_memory_mb), a lower objective or a larger gap. Returns one message per regression
+def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.25, gap_tolerance=0.005, min_seconds=0.25,
+            min_memory_mb=1.0):
+    baseline = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline.get(result["name"])
+        if reference is None:
+            continue
+        name = result["name"]
+        for stage, values in result["stages"].items():
+            before = reference["stages"].get(stage)
+            if before is None:
+                continue
+            seconds, seconds_before = values["seconds"], before["seconds"]
+            if seconds > seconds_before * (1 + time_tolerance) and seconds - seconds_before >= min_seconds:
+                regressions.append(f"{name} / {stage}: {seconds:.3f} s instead of {seconds_before:.3f} s")
+            memory, memory_before = values["peak_memory_mb"], before["peak_memory_mb"]
+            if memory > memory_before * (1 + memory_tolerance) and memory - memory_before >= min_memory_mb:
+                regressions.append(f"{name} / {stage}: peak memory {memory:.1f} MB instead of {memory_before:.1f} MB")
+        if result["objective"] < reference["objective"] - gap_tolerance * max(abs(reference["objective"]), 1e-10):
+            regressions.append(f"{name}: objective {result['objective']} instead of {reference['objective']}")
+        if result["gap"] > reference["gap"] + gap_tolerance:
+            regressions.append(f"{name}: gap {result['gap']:.2e} instead of {reference['gap']:.2e}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline and the models on synthetic instances")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON results of an earlier run on this machine to check for regressions "
+                                           "(no check without it)")
+    parser.add_argument("--save-baseline", help="also store the results as the new baseline")
+    parser.add_argument("--solver", default="highs", choices=["highs", "gurobi"])
+    parser.add_argument("--time-limit", type=float, default=20)
+    parser.add_argument("--mip-gap", type=float, default=0.01)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slow-down / memory growth per stage")
+    args = parser.parse_args()
+
+    results = run_suite(solver=args.solver, time_limit=args.time_limit, mip_gap=args.mip_gap)
+    save_results(results, args.output)
+    if args.save_baseline:
+        save_results(results, args.save_baseline)
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.tolerance, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,261 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+# Command-line entry point for the workflows of Main.py. Every subcommand imports the modules it needs when it runs,
+# so solving a stored parameter bundle with HiGHS, the relaxation or the decomposition loads numpy / scipy only (no
+# osmnx, geopandas, geopy, gurobipy or matplotlib), and only plot loads matplotlib.
+#
+#   python Cli.py prepare-data --model extended --output parameters_extended.npz
+#   python Cli.py solve parameters_extended.npz --budget 31000 --backend highs --output plan.json
+#   python Cli.py sweep parameters_extended.npz --budgets 25000 41000 1000 --cap 4 6 8 --fc 21 25 --output scenarios.csv
+#   python Cli.py plot plan.json --output plan.png
+#   python Cli.py tsp --formulation dfj --instance berlin52.tsp --callback
+
+# Defaults as in Main.py
+FC, VC, B, CAP, M = 21, 20, 25000, 6, 999999
+
+TSP_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "TSP")
+
+
+# ---------------------------------------------------Subcommands--------------------------------------------------------
+
+
+def prepare_data(args):
+    import DataGenerationAndProcessing as data
+    import ParameterBundle
+    import Routing
+
+    od_pairs = Routing.load_od_pairs(args.od_pairs) if args.od_pairs else Routing.OD_PAIRS
+    if args.model == "extended":
+        import DataGenerationAndProcessingExtended as extendedData
+
+        coords, routes_nodes, routes_length, G = extendedData.get_routesandpaths(od_pairs, args.routing_backend,
+                                                                                 args.path_algorithm)
+        annual_trips = data.get_flows(coords, routes_length)
+        Q, P, K, N_qp, f_q, f_qp, d_k = extendedData.get_parameters_extended(routes_nodes, annual_trips,
+                                                                             routes_length, G)
+        bundle = ParameterBundle.ParameterBundle.from_extended(Q, P, K, N_qp, f_qp, d_k, G)
+    else:
+        coords, routes_nodes, routes_length, G = data.get_routes(od_pairs, args.routing_backend)
+        annual_trips = data.get_flows(coords, routes_length)
+        Q, K, N_q, f_q, d_k = data.get_parameters(routes_nodes, G, annual_trips)
+        bundle = ParameterBundle.ParameterBundle.from_base(Q, K, N_q, f_q, d_k, G)
+
+    output = args.output or f"parameters_{args.model}.npz"
+    bundle.save(output)
+    print(f"Stored {len(bundle.Q)} OD-pairs and {len(bundle.K)} candidate nodes in {output}")
+
+
+def solve(args):
+    import MatrixModel
+    import ParameterBundle
+
+    start = time.perf_counter()
+    bundle = ParameterBundle.ParameterBundle.load(args.bundle)
+    min_service = MatrixModel.min_service_for(args.min_service, bundle.is_extended)
+
+    if args.method == "mip":
+        import SolverBackend
+
+        formulation = SolverBackend.formulation(bundle, args.fc, args.vc, args.budget, args.cap, args.M, min_service,
+                                                args.presolve)
+        result = SolverBackend.get_backend(args.backend, output=args.verbose).solve(formulation, args.time_limit)
+        objective, bound, gap, status, plan = result.objective, result.bound, result.gap, result.status, \
+            result.stations()
+    else:
+        params = bundle.sparse_parameters()
+        if args.presolve:
+            import Presolve
+            params = Presolve.reduce(params, min(args.cap, args.M)).reduced
+        if args.method == "relaxed":
+            import Heuristic
+            solution = Heuristic.solve_relaxed(params, args.fc, args.vc, args.budget, args.cap, min_service)
+        else:
+            import Decomposition
+            solution = Decomposition.solve(params, args.fc, args.vc, args.budget, args.cap, args.M, min_service,
+                                           args.processes, args.backend, time_limit=args.time_limit)
+        objective, bound, gap, plan = solution.objective, solution.bound, solution.gap, solution.stations()
+        status = "feasible" if solution.feasible else "infeasible"
+
+    runtime = time.perf_counter() - start
+    print(f"Objective {objective}, bound {bound}, gap {gap}, status {status} ({round(runtime, 2)} s)")
+    for k, modules in plan.items():
+        print(f" Node {k}:", modules, "modules")
+
+    if args.output:
+        stations = []
+        for k, modules in plan.items():
+            x, y = bundle.node_coordinates.get(k, (math.nan, math.nan))
+            stations.append({"node": k, "modules": modules, "x": None if math.isnan(x) else x,
+                             "y": None if math.isnan(y) else y})
+        report = {"bundle": args.bundle, "method": args.method, "backend": args.backend, "FC": args.fc, "VC": args.vc,
+                  "B": args.budget, "CAP": args.cap, "min_service": min_service, "objective": objective,
+                  "bound": bound, "gap": gap, "status": status, "runtime": runtime, "stations": stations}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Stored the plan in {args.output}")
+
+
+def sweep(args):
+    import Sweep
+
+    start, stop, step = args.budgets
+    scenarios = Sweep.scenario_grid(B=range(start, stop, step), CAP=args.cap, FC=args.fc, VC=args.vc,
+                                    min_service=args.min_service or [None])
+    results = Sweep.run_scenarios(args.bundle, scenarios, args.output, processes=args.processes,
+                                  time_limit=args.time_limit, M=args.M, parquet_path=args.parquet,
+                                  backend=args.backend)
+    print(results)
+
+
+# Coverage-vs-budget curves of a sweep (CSV), one curve per combination of the other scenario parameters
+def plot_sweep(args):
+    import matplotlib
+    if args.output:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    results = pd.read_csv(args.input)
+    others = [column for column in ["CAP", "FC", "VC", "min_service"] if results[column].nunique(dropna=False) > 1]
+    groups = results.groupby(others, dropna=False) if others else [((), results)]
+    for values, group in groups:
+        group = group.sort_values("B")
+        values = values if isinstance(values, tuple) else (values,)
+        label = ", ".join(f"{name}={value}" for name, value in zip(others, values)) or None
+        plt.plot(group["B"] / 1000, group["objective"], marker='o', label=label)
+    plt.xlabel('Budget in $ Mio')
+    plt.ylabel('Flow covered/ 30 min')
+    plt.title('Objective Value related to Budget')
+    plt.grid(True)
+    if others:
+        plt.legend()
+
+    if args.output:
+        plt.savefig(args.output, dpi=args.dpi, bbox_inches='tight')
+    else:
+        plt.show()
+
+
+# Map of the stations of a plan from solve (JSON), rendered headless into the output file if there is one
+def plot_plan(args):
+    import GraphCache
+    import Visualize
+
+    with open(args.input, encoding="utf-8") as f:
+        plan = json.load(f)
+    G = GraphCache.get_graph(args.place, dist=args.dist, network_type='drive', offline=args.offline)
+    locations = [(station["x"], station["y"]) if station["x"] is not None
+                 else (G.nodes[station["node"]]['x'], G.nodes[station["node"]]['y'])
+                 for station in plan["stations"]]
+    Visualize.Visualize(locations).where_to_install(G, args.output, dpi=args.dpi)
+
+
+def plot(args):
+    if args.input.endswith(".csv"):
+        plot_sweep(args)
+    else:
+        plot_plan(args)
+    if args.output:
+        print(f"Stored the figure in {args.output}")
+
+
+# Runs one of the TSP formulations in ../TSP on an instance of TSP/instances
+def tsp(args):
+    sys.path[:0] = [os.path.dirname(TSP_FOLDER), TSP_FOLDER]
+    working_directory = os.getcwd()
+    os.chdir(TSP_FOLDER)  # import_tsp_instance reads instances/<name> relative to the working directory
+    try:
+        from create_tour import create_tour
+        from import_TSP import import_tsp_instance
+
+        distances = import_tsp_instance(args.instance)
+        if args.formulation == "mtz":
+            import TSP_MTZ
+            arcs_used = TSP_MTZ.TSP().run(distances)
+        else:
+            import TSP_DFJ
+            arcs_used = TSP_DFJ.TSP_DFJ().run(distances, ACTIVATE_CALLBACK=args.callback)
+    finally:
+        os.chdir(working_directory)
+    print(f"{args.instance}: {create_tour(arcs_used)}")
+
+
+# ---------------------------------------------------Arguments----------------------------------------------------------
+
+
+def parser():
+    main_parser = argparse.ArgumentParser(description="Charging station location models for Munich")
+    subparsers = main_parser.add_subparsers(dest="command", required=True)
+
+    command = subparsers.add_parser("prepare-data", help="route the OD-pairs and store the model parameters")
+    command.add_argument("--model", choices=["base", "extended"], default="extended")
+    command.add_argument("--output", help="parameter bundle (.npz), default parameters_<model>.npz")
+    command.add_argument("--od-pairs", help="CSV file with the columns origin,destination")
+    command.add_argument("--routing-backend", choices=["networkx", "csgraph", "alt"], default="networkx")
+    command.add_argument("--path-algorithm", choices=["edge_disjoint", "k_shortest", "penalty"],
+                         default="edge_disjoint", help="alternative paths of the extended model")
+    command.set_defaults(function=prepare_data)
+
+    # Costs and solver options; a sweep takes a list of fixed and module costs for its grid
+    def add_costs(command, grid=False):
+        nargs = "+" if grid else None
+        command.add_argument("--fc", type=float, nargs=nargs, default=[FC] if grid else FC,
+                             help="fixed cost of a station")
+        command.add_argument("--vc", type=float, nargs=nargs, default=[VC] if grid else VC, help="cost of a module")
+        command.add_argument("--M", type=float, default=M)
+        command.add_argument("--time-limit", type=float, default=120)
+        command.add_argument("--backend", choices=["gurobi", "highs"], default="highs")
+        command.add_argument("--processes", type=int)
+
+    command = subparsers.add_parser("solve", help="solve a stored parameter bundle")
+    command.add_argument("bundle")
+    command.add_argument("--budget", type=float, default=B)
+    command.add_argument("--cap", type=int, default=CAP, help="module cap per station")
+    command.add_argument("--min-service", type=float, help="default 0.4 for the extended model, 0 for none")
+    command.add_argument("--method", choices=["mip", "relaxed", "decomposed"], default="mip")
+    command.add_argument("--presolve", action="store_true", help="aggregate interchangeable candidate nodes (all methods)")
+    command.add_argument("--output", help="JSON file for the plan")
+    command.add_argument("--verbose", action="store_true", help="show the solver log")
+    add_costs(command)
+    command.set_defaults(function=solve)
+
+    command = subparsers.add_parser("sweep", help="solve a grid of scenarios of a stored parameter bundle")
+    command.add_argument("bundle")
+    command.add_argument("--budgets", type=int, nargs=3, metavar=("START", "STOP", "STEP"),
+                         default=[25000, 41000, 1000])
+    command.add_argument("--cap", type=int, nargs="+", default=[CAP])
+    command.add_argument("--min-service", type=float, nargs="+", help="default 0.4 for the extended model, 0 for none")
+    command.add_argument("--output", default="scenarios.csv", help="CSV file, an interrupted sweep resumes from it")
+    command.add_argument("--parquet", help="also store the results as Parquet")
+    add_costs(command, grid=True)
+    command.set_defaults(function=sweep)
+
+    command = subparsers.add_parser("plot", help="draw a plan (JSON from solve) or a sweep (CSV)")
+    command.add_argument("input")
+    command.add_argument("--output", help="image file; without it the figure is shown")
+    command.add_argument("--dpi", type=int, default=150)
+    command.add_argument("--place", default="Munich, Germany")
+    command.add_argument("--dist", type=int, default=5000)
+    command.add_argument("--offline", action="store_true", help="use the graph cache only")
+    command.set_defaults(function=plot)
+
+    command = subparsers.add_parser("tsp", help="solve a TSP instance of TSP/instances")
+    command.add_argument("--formulation", choices=["mtz", "dfj"], default="dfj")
+    command.add_argument("--instance", default="berlin52.tsp")
+    command.add_argument("--callback", action="store_true", help="DFJ subtour cuts as lazy constraints")
+    command.set_defaults(function=tsp)
+    return main_parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
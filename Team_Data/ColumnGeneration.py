@@ -0,0 +1,204 @@
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+import Heuristic
+import ParameterBundle
+import SparseParameters
+
+# Column generation of alternative paths for the extended model. Every OD-pair starts with its shortest path only.
+# In the master every path p of OD-pair q has its own share y_qp of the OD flow f_q:
+#
+#   max  sum_q f_q sum_p y_qp
+#   s.t. the rows of Heuristic.tight_formulation for every path (y_qp <= coverage of path p)
+#        OD share                       sum_p y_qp <= 1             for every OD-pair
+#        Minimum service ratio          sum_p y_qp >= min_service   (optional)
+#
+# so a new path adds flow of its own instead of diluting the flow of the paths already there. The node demands d_k
+# are the given ones (e.g. the d_k of get_parameters or get_parameters_extended) where known; nodes off the starting
+# paths get the demand of the get_parameters_extended rule (every path through the node adds half of its OD flow), so
+# new paths bring new candidate nodes into the model. Nodes without positive demand cannot hold a station.
+# Each round solves the LP relaxation of the master. A new path of an OD-pair whose shares do not reach 1 has reduced
+# cost f_q - (dual of its OD share row) > 0 and can carry as much flow as the modules of the LP cover on it, so the
+# pricing oracle is a Dijkstra on
+#
+#   length * (1 - theta * coverage(head node) / max coverage),    coverage(k) = x_k / d_k
+#
+# which bends routes through nodes the LP has already equipped, within a detour limit on the true length. A candidate
+# path is added only if the LP optimum improves with it, so the model grows by useful paths only and OD-pairs may end
+# up with different numbers of paths. The exported flows f_qp split f_q over the paths in proportion to their LP shares.
+
+
+# Nodes of a road path that may hold a station (all of them without candidates)
+def candidate_nodes(path, candidates=None):
+    if candidates is None:
+        return list(path)
+    return [node for node in path if node in candidates]
+
+
+# Appends a named block of rows to a MatrixModel.Formulation
+def add_rows(formulation, name, rows, sense, rhs):
+    start = formulation.A.shape[0]
+    formulation.row_blocks[name] = slice(start, start + rows.shape[0])
+    formulation.A = sp.vstack([formulation.A, rows], format='csr')
+    formulation.sense = np.concatenate([formulation.sense, np.full(rows.shape[0], sense)])
+    formulation.rhs = np.concatenate([formulation.rhs, rhs])
+
+
+class ColumnGeneration:
+
+    # routes_nodes {q: nodes} and routes_length {q: metres} are the shortest paths (e.g. from get_routes or
+    # Routing.route_od_pairs), f_q {q: flow}, candidates an optional set of nodes that may hold a station (e.g. nodes
+    # near parking), d_k an optional {node: demand} for the graph nodes
+    def __init__(self, G, routes_nodes, routes_length, f_q, FC, VC, B, CAP, min_service=None, candidates=None,
+                 d_k=None, weight='length'):
+        self.G = G
+        self.f_q = f_q
+        self.d_k = d_k
+        self.FC, self.VC, self.B, self.CAP = FC, VC, B, CAP
+        self.min_service = min_service
+        self.candidates = set(candidates) if candidates is not None else None
+        self.weight = weight
+
+        self.Q = list(routes_nodes.keys())
+        self.endpoints = {q: (routes_nodes[q][0], routes_nodes[q][-1]) for q in self.Q}
+        self.shortest_length = routes_length
+        # Full road paths {q: {p: nodes}} and their lengths; the model only sees their candidate nodes
+        self.routes = {q: {1: routes_nodes[q]} for q in self.Q}
+        self.lengths = {q: {1: routes_length[q]} for q in self.Q}
+        # LP share of every path {q: {p: y_qp}} of the last master solve
+        self.shares = None
+        self.history = []
+
+    # Demand {node: d_k} of the nodes on the given paths: the given d_k where known, else half of the OD flow per path
+    # through the node
+    def demand(self, routes=None):
+        routes = routes if routes is not None else self.routes
+        N_qp = {q: dict(routes[q]) for q in self.Q}
+        half_flows = {q: {p: self.f_q[q] / 2 for p in routes[q]} for q in self.Q}
+        derived = SparseParameters.SparseParameters.from_paths(N_qp, half_flows).d_k()
+        if self.d_k is None:
+            return derived
+        return {node: self.d_k.get(node, demand) for node, demand in derived.items()}
+
+    def N_qp(self, routes=None):
+        routes = routes if routes is not None else self.routes
+        d_k = self.demand(routes)
+        return {q: {p: [node for node in candidate_nodes(path, self.candidates) if d_k[node] > 0]
+                    for p, path in routes[q].items()} for q in self.Q}
+
+    # Every path column carries the whole OD flow; the OD share rows of master() keep the sum of its shares at 1
+    def parameters(self, routes=None):
+        routes = routes if routes is not None else self.routes
+        N_qp = self.N_qp(routes)
+        od_flows = {q: {p: self.f_q[q] for p in routes[q]} for q in self.Q}
+        return SparseParameters.SparseParameters.from_paths(N_qp, od_flows, d_k=self.demand(routes))
+
+    # LP relaxation of the master on the path columns of params
+    def master(self, params):
+        formulation = Heuristic.tight_formulation(params, self.FC, self.VC, self.B, self.CAP)
+        od_index = {q: i for i, q in enumerate(self.Q)}
+        shares = sp.csr_matrix((np.ones(formulation.n_paths),
+                                ([od_index[q] for q, _ in params.path_keys], np.arange(formulation.n_paths))),
+                               shape=(len(self.Q), formulation.n_paths))
+        rows = sp.hstack([shares, sp.csr_matrix((len(self.Q), 2 * formulation.n_nodes))], format='csr')
+        add_rows(formulation, "OD share", rows, '<', np.ones(len(self.Q)))
+        if self.min_service is not None:
+            add_rows(formulation, "Minimum service ratio", rows, '>', np.full(len(self.Q), float(self.min_service)))
+        return formulation
+
+    # LP optimum and solution of the master on the given paths
+    def solve_master(self, routes=None):
+        params = self.parameters(routes)
+        formulation = self.master(params)
+        value, values, _ = Heuristic.solve_lp(formulation)
+        return params, formulation, value, values
+
+    # Coverage x_k / d_k the LP modules give every node: {node: coverage}
+    def node_coverage(self, params, formulation, values):
+        coverage = np.minimum(values[formulation.x] / params.demand, 1)
+        return dict(zip(params.nodes.tolist(), coverage.tolist()))
+
+    # Path for OD-pair q through covered nodes, or None if it breaks the detour limit
+    def price(self, q, node_coverage, theta=0.9, detour=0.3):
+        highest = max(node_coverage.values(), default=0)
+        if highest <= 0:
+            return None, None
+        weight = self.weight
+
+        def discounted(u, v, edges):
+            length = min(data.get(weight, 1) for data in edges.values()) if self.G.is_multigraph() \
+                else edges.get(weight, 1)
+            return length * (1 - theta * node_coverage.get(v, 0) / highest)
+
+        origin, destination = self.endpoints[q]
+        path = nx.dijkstra_path(self.G, origin, destination, weight=discounted)
+        length = nx.path_weight(self.G, path, weight)
+        if length > (1 + detour) * self.shortest_length[q]:
+            return None, None
+        return path, length
+
+    def store_shares(self, params, formulation, values):
+        self.shares = {q: {} for q in self.Q}
+        for (q, p), share in zip(params.path_keys, values[formulation.y].tolist()):
+            self.shares[q][p] = share
+
+    # Runs up to rounds pricing rounds with at most max_paths paths per OD-pair. Stops early once a round adds nothing
+    def run(self, rounds=10, max_paths=5, theta=0.9, detour=0.3, tolerance=1e-6):
+        params, formulation, value, values = self.solve_master()
+        if value is None:
+            raise ValueError("The LP relaxation of the model on the shortest paths is infeasible")
+        self.store_shares(params, formulation, values)
+        self.history.append({"round": 0, "paths": len(params.path_keys), "lp_objective": value})
+        print(f"Column generation round 0: {len(params.path_keys)} paths, LP objective {round(value, 4)}")
+
+        for round_number in range(1, rounds + 1):
+            node_coverage = self.node_coverage(params, formulation, values)
+            added = 0
+            for q in self.Q:
+                # Only OD-pairs with positive flow left to serve have a path with positive reduced cost
+                if len(self.routes[q]) >= max_paths or self.f_q[q] <= 0 \
+                        or sum(self.shares[q].values()) >= 1 - tolerance:
+                    continue
+                path, length = self.price(q, node_coverage, theta, detour)
+                if path is None or any(path == existing for existing in self.routes[q].values()):
+                    continue
+                p = max(self.routes[q]) + 1
+                trial = dict(self.routes)
+                trial[q] = {**self.routes[q], p: path}
+                _, _, trial_value, _ = self.solve_master(trial)
+                if trial_value is not None and trial_value > value + tolerance:
+                    self.routes = trial
+                    self.lengths[q][p] = length
+                    value = trial_value
+                    added += 1
+
+            params, formulation, value, values = self.solve_master()
+            self.store_shares(params, formulation, values)
+            self.history.append({"round": round_number, "paths": len(params.path_keys), "lp_objective": value})
+            print(f"Column generation round {round_number}: {added} paths added, {len(params.path_keys)} paths, "
+                  f"LP objective {round(value, 4)}")
+            if added == 0:
+                break
+        return self.paths()
+
+    # Paths with a positive LP share and their flows {q: {p: f_qp}}, f_q split in proportion to the shares (the
+    # shortest path with the whole flow for OD-pairs the LP does not serve)
+    def paths(self):
+        N_qp = self.N_qp()
+        f_qp = {}
+        for q in self.Q:
+            shares = self.shares[q] if self.shares is not None else {}
+            total = sum(share for share in shares.values() if share > 1e-9)
+            if total > 0:
+                f_qp[q] = {p: self.f_q[q] * share / total for p, share in shares.items() if share > 1e-9}
+            else:
+                f_qp[q] = {1: self.f_q[q]}
+        return {q: {p: N_qp[q][p] for p in f_qp[q]} for q in self.Q}, f_qp
+
+    # Extended parameter bundle of the generated paths
+    def to_bundle(self):
+        N_qp, f_qp = self.paths()
+        d_k = self.demand({q: {p: self.routes[q][p] for p in N_qp[q]} for q in self.Q})
+        K = sorted({node for q in self.Q for path in N_qp[q].values() for node in path})
+        P = sorted({p for q in self.Q for p in N_qp[q]})
+        return ParameterBundle.ParameterBundle.from_extended(self.Q, P, K, N_qp, f_qp, d_k, self.G)
@@ -1,9 +1,10 @@
 import warnings
-import osmnx as ox
-import networkx as nx
-import math
-from geopy.distance import great_circle
-import matplotlib.pyplot as plt
+import GraphCache
+import Routing
+import LandmarkIndex
+import Geocoding
+import SparseParameters
+import FlowGeneration
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
@@ -11,7 +12,7 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 # ---------------------------------------------------Data gathering----------------------------------------------------
 
 
-def get_routes(): # Loads locations of denseley populated areas and connects them via shortest path (OD-pair creation)
+def get_routes(od_pairs=Routing.OD_PAIRS, routing_backend="networkx"): # Loads locations of denseley populated areas and connects them via shortest path (OD-pair creation)
 
     locations = {
         "Perlach": "Perlach, Munich, Germany",
@@ -32,47 +33,23 @@ def get_routes(): # Loads locations of denseley populated areas and connects the
         "Odeonsplatz": "Odeonsplatz, Munich, Germany"
     }
 
-    # Geocode locations
-    coords = {name: ox.geocode(loc) for name, loc in locations.items()}
+    # Geocode locations (read from the local gazetteer, only unknown places are looked up online)
+    coords = Geocoding.geocode_all(locations)
 
-    # Create a network graph for Munich of a reasonable size
-    G = ox.graph_from_address("Munich, Germany", network_type='drive', dist=5000)
+    # Load the network graph for Munich of a reasonable size (downloaded once, then read from the graph cache)
+    G = GraphCache.get_graph("Munich, Germany", dist=5000, network_type='drive')
 
     # Find the nearest nodes to the locations
+    import osmnx as ox
     nearest_nodes = {name: ox.distance.nearest_nodes(G, point[1], point[0]) for name, point in coords.items()}
 
 
-    # Connect OD-pairs via shortest path and store route coordinates
-    routes_nodes = {
-        "Perlach to Neuhausen": nx.shortest_path(G, nearest_nodes["Perlach"], nearest_nodes["Neuhausen"],weight='length'),
-        "Thalkirchen to Freimann": nx.shortest_path(G, nearest_nodes["Thalkirchen"], nearest_nodes["Freimann"],weight='length'),
-        "Bogenhausen to Thalkirchen": nx.shortest_path(G, nearest_nodes["Bogenhausen"], nearest_nodes["Thalkirchen"],weight='length'),
-        "Bogenhausen to Neuhausen": nx.shortest_path(G, nearest_nodes["Bogenhausen"], nearest_nodes["Neuhausen"],weight='length'),
-        "Perlach to Freimann": nx.shortest_path(G, nearest_nodes["Perlach"], nearest_nodes["Freimann"],weight='length'),
-        "Hadern to Stachus": nx.shortest_path(G, nearest_nodes["Hadern"], nearest_nodes["Stachus"],weight='length'),
-        "Moosach to Stachus": nx.shortest_path(G, nearest_nodes["Moosach"], nearest_nodes["Stachus"],weight='length'),
-        "Feldmoching to Odeonsplatz": nx.shortest_path(G, nearest_nodes["Feldmoching"], nearest_nodes["Odeonsplatz"],weight='length'),
-        "Oberfoehring to Odeonsplatz": nx.shortest_path(G, nearest_nodes["Oberfoehring"], nearest_nodes["Odeonsplatz"],weight='length'),
-        "Berg-am-Laim to Isartor": nx.shortest_path(G, nearest_nodes["Berg-am-Laim"], nearest_nodes["Isartor"],weight='length'),
-        "Giesing to Sendlinger-Tor": nx.shortest_path(G, nearest_nodes["Giesing"], nearest_nodes["Sendlinger-Tor"],weight='length'),
-        "Sendling to Sendlinger-Tor": nx.shortest_path(G, nearest_nodes["Sendling"], nearest_nodes["Sendlinger-Tor"], weight='length'),
-    }
-
-    # Stores the distance between OD-pairs
-    routes_length = {
-        "Perlach to Neuhausen": nx.shortest_path_length(G, nearest_nodes["Perlach"], nearest_nodes["Neuhausen"],weight='length'),
-        "Thalkirchen to Freimann": nx.shortest_path_length(G, nearest_nodes["Thalkirchen"], nearest_nodes["Freimann"],weight='length'),
-        "Bogenhausen to Thalkirchen": nx.shortest_path_length(G, nearest_nodes["Bogenhausen"], nearest_nodes["Thalkirchen"],weight='length'),
-        "Bogenhausen to Neuhausen": nx.shortest_path_length(G, nearest_nodes["Bogenhausen"], nearest_nodes["Neuhausen"],weight='length'),
-        "Perlach to Freimann": nx.shortest_path_length(G, nearest_nodes["Perlach"], nearest_nodes["Freimann"],weight='length'),
-        "Hadern to Stachus": nx.shortest_path_length(G, nearest_nodes["Hadern"], nearest_nodes["Stachus"],weight='length'),
-        "Moosach to Stachus": nx.shortest_path_length(G, nearest_nodes["Moosach"], nearest_nodes["Stachus"],weight='length'),
-        "Feldmoching to Odeonsplatz": nx.shortest_path_length(G, nearest_nodes["Feldmoching"], nearest_nodes["Odeonsplatz"],weight='length'),
-        "Oberfoehring to Odeonsplatz": nx.shortest_path_length(G, nearest_nodes["Oberfoehring"], nearest_nodes["Odeonsplatz"],weight='length'),
-        "Berg-am-Laim to Isartor": nx.shortest_path_length(G, nearest_nodes["Berg-am-Laim"], nearest_nodes["Isartor"],weight='length'),
-        "Giesing to Sendlinger-Tor": nx.shortest_path_length(G, nearest_nodes["Giesing"], nearest_nodes["Sendlinger-Tor"],weight='length'),
-        "Sendling to Sendlinger-Tor": nx.shortest_path_length(G, nearest_nodes["Sendling"], nearest_nodes["Sendlinger-Tor"], weight='length'),
-    }
+    # Connect OD-pairs via shortest path and store route coordinates and the distance between OD-pairs
+    # (one Dijkstra per origin yields both; routing_backend="csgraph" runs them on a CSR copy of the graph, "alt" uses
+    # A* on the landmark index saved next to the graph cache)
+    if routing_backend == "alt":
+        routing_backend = LandmarkIndex.get_index("Munich, Germany", dist=5000, network_type='drive')
+    routes_nodes, routes_length = Routing.route_od_pairs(G, nearest_nodes, od_pairs, backend=routing_backend)
 
     print(routes_length)
     return coords, routes_nodes, routes_length, G
@@ -80,47 +57,20 @@ def get_routes(): # Loads locations of denseley populated areas and connects the
 
 def get_flows(coords, routes_length): # Generate annual flow volumes on OD-paths
 
-    # Function calculating centroids for given coordinates
-    def calculate_centroid(coords):
-        latitudes = [coord[0] for coord in coords.values()]
-        longitudes = [coord[1] for coord in coords.values()]
-        return sum(latitudes) / len(latitudes), sum(longitudes) / len(longitudes)
-
-    # Store the centroid of the nodes
-    centroid = calculate_centroid(coords)
-
-    # Function to calculate distance between two points
-    def calculate_distance(point1, point2):
-        return great_circle(point1, point2).kilometers
-
-    # Store the maximum distance from the centroid to any node
-    max_distance_to_centroid = max(calculate_distance(centroid, point) for point in coords.values())
-
-    # Store the area of the circle
-    area_of_circle = math.pi * (max_distance_to_centroid ** 2)
-
+    # Constant of the gravity model based on the circle around the centroid of the nodes that contains all nodes and
     # Munich's population density (people per square km): https://en.wikipedia.org/wiki/Munich
-    population_density = 4900
-
-    # Calculate C based on the area and population density
-    C = area_of_circle * population_density
-
-    # Custom function to estimate trips
-    def estimate_trips(distance, C, alpha):
-        return C * math.exp(-alpha * distance)
+    lats = [point[0] for point in coords.values()]
+    lons = [point[1] for point in coords.values()]
+    C = FlowGeneration.gravity_constant(lats, lons, population_density=4900)
 
     # Constants for the model
     alpha = 0.1  # Decay constant, adjust based on scenario
 
-    # Calculate estimated trips for each route
-    estimated_trips = {}
-    for route in routes_length.keys():
-        distance = routes_length[route] / 1000  # Distance for the route in km
-        trips = estimate_trips(distance, C, alpha)
-        estimated_trips[route] = trips
-
-    # Storing annual trips, assuming 230 working days a year https://www.steuergo.de/en/rechner/arbeitstage
-    annual_trips = {route: trips * 230 for route, trips in estimated_trips.items()}
+    # Estimated trips C * exp(-alpha * distance) for all routes at once, stored as annual trips assuming 230 working
+    # days a year https://www.steuergo.de/en/rechner/arbeitstage
+    routes = list(routes_length.keys())
+    trips = FlowGeneration.annual_trips([routes_length[route] for route in routes], C, alpha, working_days=230)
+    annual_trips = dict(zip(routes, trips.tolist()))
 
     return annual_trips
 
@@ -151,6 +101,8 @@ def get_parameters(routes_nodes, G, annual_trips): # Generate all necessary para
 
     #Uncomment to load total and individual path flows
     '''
+    import matplotlib.pyplot as plt
+
     f_q_values = list(f_q.values())
     od_indices = range(len(f_q))
 
@@ -168,12 +120,8 @@ def get_parameters(routes_nodes, G, annual_trips): # Generate all necessary para
     print(total_flow)
     '''
 
-    # Summed demand on node keK based on all flows
-    d_k = {node: 0 for node in G.nodes()}
-    for od, route in routes_nodes.items():
-        flow = f_q[od]  # Flow for the current OD pair
-        for node in route:
-            d_k[node] += flow  # Add the flow to the demand of the node
+    # Summed demand on node keK based on all flows, one sparse product over the path-by-node incidence of K
+    d_k = SparseParameters.SparseParameters.from_routes(N_q, f_q, nodes=K).d_k()
 
     for od, route in N_q.items():
         print(f"OD Pair '{od}' with flow {f_q[od]} per 30 minutes:")
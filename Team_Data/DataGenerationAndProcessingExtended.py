@@ -1,16 +1,12 @@
 
-import warnings
-import geopandas as gpd
-import osmnx as ox
-import networkx as nx
-from DataGenerationAndProcessing import get_flows
-from shapely.geometry import Point, LineString
-import geopy.distance
-from geopandas.tools import sjoin
-import numpy as np
+import GraphCache
+import Routing
+import LandmarkIndex
+import SparseParameters
+import Geocoding
 
 # Loads locations of denseley populated areas and connects them via shortest path and two additional perfectly divergent paths
-def get_routesandpaths():
+def get_routesandpaths(od_pairs=Routing.OD_PAIRS, routing_backend="networkx", path_algorithm="edge_disjoint"):
     locations = {
         "Perlach": "Perlach, Munich, Germany",
         "Neuhausen": "Neuhausen, Munich, Germany",
@@ -30,102 +26,34 @@ def get_routesandpaths():
         "Odeonsplatz": "Odeonsplatz, Munich, Germany"
     }
 
-    # Function finding the nearest node with more than min_edges in-/outgoing edges
-    def find_nearest_crossing(G, point, min_edges, increment=0.0001):
-        while True:
-            nearest_node = ox.distance.nearest_nodes(G, point[1], point[0], return_dist=False)
-            if G.degree[nearest_node] >= min_edges:
-                return nearest_node
-            else:
-                point = (point[0] + increment, point[1] + increment)
+    # Geocode locations (read from the local gazetteer, only unknown places are looked up online)
+    coords = Geocoding.geocode_all(locations)
 
-    # Geocode locations
-    coords = {name: ox.geocode(loc) for name, loc in locations.items()}
+    # Load the network graph for Munich (downloaded once, then read from the graph cache)
+    G = GraphCache.get_graph("Munich, Germany", dist=5000, network_type='drive')
 
-    # Create a network graph for Munich
-    G = ox.graph_from_address("Munich, Germany", network_type='drive', dist=5000)
+    # Spatial queries need geopandas, imported only here so parameter generation from routes does not load it
+    import SpatialIndex
 
-    # Find the nearest crossing nodes to the OD-locations with at least six in-/outgoing edges
-    nearest_crossings = {}
-    for name, point in coords.items():
-        nearest_crossings[name] = find_nearest_crossing(G, point, min_edges=6)
+    # Find the nearest crossing nodes to the OD-locations with at least six in-/outgoing edges (one KD-tree query)
+    nearest_crossings = SpatialIndex.nearest_crossings(G, coords, min_edges=6)
 
 
     # Connect OD-pairs via shortest path and two additional perfectly divergent paths and store route coordinates
-    routesandpath_nodes = [
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Perlach"], nearest_crossings["Neuhausen"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Thalkirchen"], nearest_crossings["Freimann"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Bogenhausen"], nearest_crossings["Thalkirchen"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Bogenhausen"], nearest_crossings["Neuhausen"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Perlach"], nearest_crossings["Freimann"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Hadern"], nearest_crossings["Stachus"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Moosach"], nearest_crossings["Stachus"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Feldmoching"], nearest_crossings["Odeonsplatz"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Oberfoehring"], nearest_crossings["Odeonsplatz"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Berg-am-Laim"], nearest_crossings["Isartor"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Giesing"], nearest_crossings["Sendlinger-Tor"], cutoff=3)),
-        list(nx.edge_disjoint_paths(G, nearest_crossings["Sendling"], nearest_crossings["Sendlinger-Tor"], cutoff=3))
-    ]
-
-    # Stores the shortest distance between OD-pairs
-    routes_shortestpath_length = {
-        "Perlach to Neuhausen": nx.shortest_path_length(G, nearest_crossings["Perlach"], nearest_crossings["Neuhausen"],weight='length'),
-        "Thalkirchen to Freimann": nx.shortest_path_length(G, nearest_crossings["Thalkirchen"], nearest_crossings["Freimann"],weight='length'),
-        "Bogenhausen to Thalkirchen": nx.shortest_path_length(G, nearest_crossings["Bogenhausen"], nearest_crossings["Thalkirchen"],weight='length'),
-        "Bogenhausen to Neuhausen": nx.shortest_path_length(G, nearest_crossings["Bogenhausen"], nearest_crossings["Neuhausen"],weight='length'),
-        "Perlach to Freimann": nx.shortest_path_length(G, nearest_crossings["Perlach"], nearest_crossings["Freimann"],weight='length'),
-        "Hadern to Stachus": nx.shortest_path_length(G, nearest_crossings["Hadern"], nearest_crossings["Stachus"],weight='length'),
-        "Moosach to Stachus": nx.shortest_path_length(G, nearest_crossings["Moosach"], nearest_crossings["Stachus"],weight='length'),
-        "Feldmoching to Odeonsplatz": nx.shortest_path_length(G, nearest_crossings["Feldmoching"], nearest_crossings["Odeonsplatz"],weight='length'),
-        "Oberfoehring to Odeonsplatz": nx.shortest_path_length(G, nearest_crossings["Oberfoehring"], nearest_crossings["Odeonsplatz"],weight='length'),
-        "Berg-am-Laim to Isartor": nx.shortest_path_length(G, nearest_crossings["Berg-am-Laim"], nearest_crossings["Isartor"],weight='length'),
-        "Giesing to Sendlinger-Tor": nx.shortest_path_length(G, nearest_crossings["Giesing"], nearest_crossings["Sendlinger-Tor"],weight='length'),
-        "Sendling to Sendlinger-Tor": nx.shortest_path_length(G, nearest_crossings["Sendling"], nearest_crossings["Sendlinger-Tor"], weight='length'),
-    }
-
-    # Filter the nodes with public parking area
-    # Fetch parking data and prepare the GeoDataFrame
-    parking = ox.features_from_place("Munich, Germany", tags={'amenity': 'parking'})
-    parking_locations = parking[(parking['access'] == 'yes') & (parking['parking'].isin(['surface', 'street_side']))]['geometry']
-    parking_locations_gdf = gpd.GeoDataFrame(geometry=parking_locations.centroid)
-
-    # Prepare the nodes GeoDataFrame
-    nodes_list = [node for path_list in routesandpath_nodes for path in path_list for node in path]
-    nodes_points = [Point(G.nodes[node]['x'], G.nodes[node]['y']) for node in nodes_list]
-    nodes_gdf = gpd.GeoDataFrame(geometry=nodes_points, index=nodes_list)
-
-    nodes_within_100m_of_parking = []
-
-    for node_idx, node_row in nodes_gdf.iterrows():
-        # Check each parking location for its distance to the current node
-        match_found = False  # Flag to indicate if a parking location within 100m is found
-        for _, parking_row in parking_locations_gdf.iterrows():
-            distance = node_row.geometry.distance(parking_row.geometry)
-            if distance < 0.003:  # Check if distance is less than 100 meters
-                nodes_within_100m_of_parking.append(node_idx)  # Save node ID
-                match_found = True  # Set flag to True
-                break  # Exit the loop once a match is found
-
-        if match_found:
-            continue  # Move to the next node
-
-    # Filter nodes_gdf to keep only nodes within 100m of parking locations
-    filtered_nodes_gdf = nodes_gdf.loc[nodes_within_100m_of_parking]
-
-    # To re-create the routesandpath_nodes structure with filtered nodes
-    filtered_routesandpath_nodes = []
-
-    for path_list in routesandpath_nodes:
-        filtered_od_pair_paths = []
+    # (one task per OD-pair on a process pool; path_algorithm "k_shortest" or "penalty" gives other alternatives)
+    routes_paths, _ = Routing.alternative_paths(G, nearest_crossings, od_pairs, k=3, algorithm=path_algorithm)
+    routesandpath_nodes = [routes_paths[Routing.od_name(origin, destination)] for origin, destination in od_pairs]
 
-        for path in path_list:
-            # Filter the path to keep only nodes that are within 100m of a parking location
-            filtered_path = [node for node in path if node in filtered_nodes_gdf.index]
-            if filtered_path:  # Ensure the filtered path is not empty
-                filtered_od_pair_paths.append(filtered_path)
+    # Stores the shortest distance between OD-pairs (one Dijkstra per origin, on a CSR copy with "csgraph", or A* on
+    # the landmark index saved next to the graph cache with "alt")
+    if routing_backend == "alt":
+        routing_backend = LandmarkIndex.get_index("Munich, Germany", dist=5000, network_type='drive')
+    _, routes_shortestpath_length = Routing.route_od_pairs(G, nearest_crossings, od_pairs, backend=routing_backend)
 
-        if filtered_od_pair_paths:  # Ensure there's at least one path for the OD pair
-            filtered_routesandpath_nodes.append(filtered_od_pair_paths)
+    # Filter the nodes with public parking area within 300 m (one spatial join in metric coordinates)
+    parking_locations_gdf = SpatialIndex.get_parking_centroids("Munich, Germany")
+    filtered_routesandpath_nodes = SpatialIndex.filter_paths_by_parking(G, routesandpath_nodes, parking_locations_gdf,
+                                                                        max_distance=300)
 
     routesandpath_nodes = filtered_routesandpath_nodes
     total_nodes_filtered = 0
@@ -147,8 +75,8 @@ def get_parameters_extended(routesandpath_nodes, annual_trips,routes_shortestpat
     # OD-pairs based on our routesandpath_nodes lists (as strings)
     Q = list(routes_shortestpath_length.keys())
 
-    # Path options
-    P = [1,2,3]
+    # Path options (shortest path and its alternatives; an OD-pair may keep fewer after the parking filter)
+    P = list(range(1, max(len(route_paths) for route_paths in routesandpath_nodes) + 1))
 
     # Nodes based on our routesandpath_nodes values within lists (as value)
     K = set()
@@ -158,7 +86,7 @@ def get_parameters_extended(routesandpath_nodes, annual_trips,routes_shortestpat
     K = list(K)
 
     # Set of nodes capable of capturing the flow of OD-pair q, on path p. First path is the shortest path
-    N_qp = {q: {p: routesandpath_nodes[Q.index(q)][p-1] for p in P} for q in Q}
+    N_qp = {q: {p: path for p, path in enumerate(routesandpath_nodes[Q.index(q)], start=1)} for q in Q}
 
     # Charges/ year of one fast charger (assuming demand only on the 230 working days) with 30 mins for full charge
     Charger_annual_capacity = 11040 #vehicles/yr
@@ -176,23 +104,13 @@ def get_parameters_extended(routesandpath_nodes, annual_trips,routes_shortestpat
     # Flows through path options of OD-pairs on each 30 mins - adapt based on scenario
     f_qp = {}
     for od, value in f_q.items():
-        # Explicitly assign the percentages to each path option
-        f_qp[od] = {
-            1: value * (1/3),
-            2: value * (1/3),
-            3: value * (1/3)
-        }
-
-    # Summed demand on node keK based on all flows
-    d_k = {node: 0 for node in G.nodes}
-    for route_list in routesandpath_nodes:
-        for route in route_list:
-            for node in route:
-                for i in range(1, 4):
-                    od_key = int(i)
-                    flow = f_qp.get(od, {}).get(od_key, 0)
-                    d_k[node] += flow/2
+        # Equal share for each path option of the OD-pair
+        f_qp[od] = {p: value * (1/len(N_qp[od])) for p in N_qp[od]}
 
+    # Summed demand on node keK: every path of OD-pair q adds half of the OD flow to its nodes. One sparse
+    # matrix-vector product over the path-node incidence, so it scales with the route nodes and not with G
+    path_flows = {q: {p: f_q[q] / 2 for p in N_qp[q]} for q in Q}
+    d_k = SparseParameters.SparseParameters.from_paths(N_qp, path_flows, nodes=K).d_k()
 
     return Q, P, K, N_qp, f_q, f_qp, d_k
 
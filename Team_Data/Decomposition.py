@@ -0,0 +1,129 @@
+import copy
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+import Heuristic
+import MatrixModel
+import SolverBackend
+
+# Lagrangian decomposition of the budget. OD groups that share no candidate node (connected components of the
+# path-node incidence) are coupled only by Budget_Constraint. Moving the budget into the objective with a multiplier
+# lambda >= 0 splits the model into one independent subproblem per component:
+#
+#   max  f' y - lambda * (FC * sum z + VC * sum x)   without a budget row
+#
+# and L(lambda) = lambda * B + sum of the subproblem optima is an upper bound for every lambda. The subproblems are
+# solved in parallel processes and lambda is bisected on the spent budget. Every evaluated lambda also gives a
+# feasible plan: the subproblem plans are cut back to the budget (Heuristic.repair), filled up to the minimum service
+# (Heuristic.serve) and the rest is spent greedily; the best one is polished by Heuristic.local_search.
+
+
+# (path rows, node columns) of every connected component that contains a path
+def components(params):
+    n_paths, n_nodes = params.incidence.shape
+    incidence = params.incidence.astype(bool).astype(np.int8)
+    graph = sp.bmat([[None, incidence], [incidence.T, None]], format='csr')
+    _, labels = connected_components(graph, directed=False)
+    path_labels, node_labels = labels[:n_paths], labels[n_paths:]
+    return [(np.flatnonzero(path_labels == label), np.flatnonzero(node_labels == label))
+            for label in np.unique(path_labels).tolist()]
+
+
+# Formulation of each component without a budget limit
+def subproblems(params, FC, VC, CAP, M, min_service=None):
+    return [(columns, MatrixModel.Formulation(params.select_paths(rows).select_nodes(columns), FC, VC, np.inf, CAP, M,
+                                              min_service))
+            for rows, columns in components(params)]
+
+
+# The subproblem with the budget priced into the objective
+def priced(formulation, multiplier, FC, VC):
+    formulation = copy.copy(formulation)
+    formulation.c = formulation.c.copy()
+    formulation.c[formulation.x] = -multiplier * VC
+    formulation.c[formulation.z] = -multiplier * FC
+    return formulation
+
+
+# State of a worker process: all subproblems, sent once per worker
+_worker_state = {}
+
+
+def _init_worker(problems, FC, VC, backend, time_limit):
+    _worker_state.update(problems=problems, FC=FC, VC=VC, backend=backend, time_limit=time_limit)
+
+
+# Optimum, spent budget and modules of subproblem i at the given multiplier
+def _solve_subproblem(task):
+    i, multiplier = task
+    state = _worker_state
+    columns, formulation = state["problems"][i]
+    options = {"output": False, "threads": 1} if state["backend"] == "gurobi" else {"output": False}
+    result = SolverBackend.get_backend(state["backend"], **options).solve(
+        priced(formulation, multiplier, state["FC"], state["VC"]), state["time_limit"])
+    if result.values is None:
+        return i, None, 0.0, None
+    modules = np.round(result.values[formulation.x]).astype(np.int64)
+    opened = np.count_nonzero(result.values[formulation.z] > 0.5)
+    # The bound needs the subproblem's own bound, not only its incumbent, when it stops at the time limit
+    return i, result.bound, state["FC"] * opened + state["VC"] * modules.sum(), modules
+
+
+# Solves the model by bisection on the budget multiplier. Returns a Heuristic.Solution with the best feasible plan and
+# the lowest Lagrangian bound; solution.multiplier is the multiplier of the final bisection step
+def solve(params, FC, VC, B, CAP, M, min_service=None, processes=None, backend="highs", iterations=20,
+          time_limit=60, tolerance=1e-4):
+    start = time.perf_counter()
+    problems = subproblems(params, FC, VC, CAP, M, min_service)
+    instance = Heuristic.Instance(params, FC, VC, B, min(CAP, M), min_service)
+    processes = max(1, min(processes or os.cpu_count() or 1, len(problems)))
+    print(f"Decomposition into {len(problems)} components on {processes} processes")
+
+    best_modules, best_objective, bound = None, -np.inf, np.inf
+    # Above this multiplier not even all positive flow pays for one station with one module
+    low, high = 0.0, instance.weights.sum() / (FC + VC) + 1e-9
+    multiplier = low
+
+    with Pool(processes, initializer=_init_worker, initargs=(problems, FC, VC, backend, time_limit)) as pool:
+        for iteration in range(iterations):
+            multiplier = (low + high) / 2 if iteration > 0 else low
+            results = pool.map(_solve_subproblem, [(i, multiplier) for i in range(len(problems))])
+            if any(value is None for _, value, _, _ in results):
+                print(f"Multiplier {multiplier}: a subproblem has no solution (minimum service not reachable)")
+                break
+
+            bound = min(bound, multiplier * B + sum(value for _, value, _, _ in results))
+            spent = sum(cost for _, _, cost, _ in results)
+
+            modules = np.zeros(len(params.nodes), dtype=np.int64)
+            for i, _, _, component_modules in results:
+                modules[problems[i][0]] = component_modules
+            modules = Heuristic.serve(instance, Heuristic.repair(instance, modules))
+            modules = Heuristic.greedy(instance, modules, np.ones(len(params.flows)), instance.weights)
+            objective = instance.objective(modules)
+            if objective > best_objective and (min_service is None or instance.service_feasible(modules)):
+                best_modules, best_objective = modules, objective
+
+            print(f"Multiplier {round(multiplier, 6)}: spent {round(spent, 2)} of {B}, bound {round(bound, 4)}, "
+                  f"best plan {round(best_objective, 4)}")
+            if spent > B:
+                low = multiplier
+            elif iteration == 0:
+                break  # the budget does not bind, the plan without it is optimal
+            else:
+                high = multiplier
+            # Without a plan that reaches the minimum service there is nothing to compare the bound with yet
+            if np.isfinite(best_objective) and bound - best_objective <= tolerance * max(abs(best_objective), 1e-10):
+                break
+
+    if best_modules is None:
+        best_modules = Heuristic.construct(instance)
+    best_modules = Heuristic.local_search(instance, best_modules)
+    solution = Heuristic.Solution(params.nodes, best_modules, instance.objective(best_modules),
+                                  instance.cost(best_modules), bound, time.perf_counter() - start,
+                                  instance.service_feasible(best_modules))
+    solution.multiplier = multiplier
+    return solution
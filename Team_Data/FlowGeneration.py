@@ -0,0 +1,91 @@
+import numpy as np
+
+# Vectorised gravity model for OD flow volumes. Distances are great-circle (haversine) distances, trips decay
+# exponentially with distance: trips = C * exp(-alpha * distance). Full OD matrices are filled row block by row block
+# and can be written straight into a memory-mapped .npy file, so metro-wide zone systems never have to fit in RAM.
+
+# Same mean earth radius as geopy's great_circle
+EARTH_RADIUS_KM = 6371.009
+
+# Munich's population density (people per square km): https://en.wikipedia.org/wiki/Munich
+POPULATION_DENSITY = 4900
+
+# Assuming 230 working days a year https://www.steuergo.de/en/rechner/arbeitstage
+WORKING_DAYS = 230
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# C of the gravity model: population of the circle around the centroid of all points that contains every point
+def gravity_constant(lats, lons, population_density=POPULATION_DENSITY):
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    max_distance_to_centroid = haversine_km(lats.mean(), lons.mean(), lats, lons).max()
+    area_of_circle = np.pi * max_distance_to_centroid ** 2
+    return area_of_circle * population_density
+
+
+def estimate_trips(distance_km, C, alpha=0.1):
+    return C * np.exp(-alpha * np.asarray(distance_km, dtype=float))
+
+
+# Annual trips for an array of route lengths in metres
+def annual_trips(lengths_m, C, alpha=0.1, working_days=WORKING_DAYS):
+    return estimate_trips(np.asarray(lengths_m, dtype=float) / 1000, C, alpha) * working_days
+
+
+# Flows per 30 minutes as used by the models: share of one fast charger's annual capacity (11040 vehicles/yr) times
+# the EVs per capita in Germany, minus the same 0.05 offset as get_parameters / get_parameters_extended
+def charging_flow(trips, charger_annual_capacity=11040, evs_per_capita=15.6 / 1000, offset=0.05):
+    return (np.asarray(trips, dtype=float) / charger_annual_capacity) * evs_per_capita - offset
+
+
+# ---------------------------------------------------OD matrices--------------------------------------------------------
+
+
+# Annual trips between all zone pairs (zero on the diagonal). With path set, the matrix is written chunk by chunk into
+# a memory-mapped .npy file and returned as np.memmap; otherwise it is returned as an in-memory array
+def od_flow_matrix(lats, lons, C=None, alpha=0.1, working_days=WORKING_DAYS, path=None, chunk_rows=1024,
+                   dtype=np.float32):
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    n = len(lats)
+    if C is None:
+        C = gravity_constant(lats, lons)
+
+    if path is None:
+        matrix = np.empty((n, n), dtype=dtype)
+    else:
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n, n))
+
+    for start in range(0, n, chunk_rows):
+        end = min(start + chunk_rows, n)
+        distance = haversine_km(lats[start:end, None], lons[start:end, None], lats[None, :], lons[None, :])
+        block = estimate_trips(distance, C, alpha) * working_days
+        block[np.arange(end - start), np.arange(start, end)] = 0
+        matrix[start:end] = block
+
+    if path is not None:
+        matrix.flush()
+    return matrix
+
+
+def open_flow_matrix(path):
+    return np.load(path, mmap_mode='r')
+
+
+# Yields (first_row, block) pairs so consumers can stream a (memory-mapped) matrix without loading it
+def iter_flow_chunks(matrix, chunk_rows=1024):
+    for start in range(0, matrix.shape[0], chunk_rows):
+        yield start, np.asarray(matrix[start:start + chunk_rows])
+
+
+# Flow of each (origin, destination) zone index pair, read in row-sorted order so a memory map is scanned once
+def gather_flows(matrix, origins, destinations):
+    origins, destinations = np.asarray(origins), np.asarray(destinations)
+    order = np.lexsort((destinations, origins))
+    flows = np.empty(len(origins), dtype=float)
+    flows[order] = matrix[origins[order], destinations[order]]
+    return flows
@@ -0,0 +1,99 @@
+import csv
+import hashlib
+import json
+import os
+from urllib.parse import urlencode
+
+# Persistent geocoding. Place names are resolved from a local gazetteer file (query,lat,lon) first; only unknown
+# names are sent to Nominatim and the answers are appended to the gazetteer, so every later run is offline and
+# returns exactly the same coordinates.
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv")
+
+# Gazetteers already read in this process: {path: {query: (lat, lon)}}
+_gazetteers = {}
+
+
+def normalize_query(query):
+    return " ".join(query.split())
+
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    if path not in _gazetteers:
+        entries = {}
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    entries[normalize_query(row['query'])] = (float(row['lat']), float(row['lon']))
+        _gazetteers[path] = entries
+    return _gazetteers[path]
+
+
+# Adds {query: (lat, lon)} entries, e.g. zone centroids, to the gazetteer file
+def add_entries(entries, path=GAZETTEER_PATH):
+    gazetteer = load_gazetteer(path)
+    new_entries = {normalize_query(query): point for query, point in entries.items()
+                   if normalize_query(query) not in gazetteer}
+    if not new_entries:
+        return
+
+    write_header = not os.path.exists(path)
+    with open(path, "a", newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(["query", "lat", "lon"])
+        for query, (lat, lon) in new_entries.items():
+            writer.writerow([query, repr(float(lat)), repr(float(lon))])
+    gazetteer.update(new_entries)
+
+
+# Reads zone centroids from a CSV file with the columns name,lat,lon into the gazetteer
+def import_centroids(csv_path, path=GAZETTEER_PATH):
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        entries = {row['name']: (float(row['lat']), float(row['lon'])) for row in csv.DictReader(f)}
+    add_entries(entries, path)
+    return entries
+
+
+# Seeds the gazetteer from answers already stored in an OSMnx request cache folder. OSMnx names each cached
+# response after the sha1 of its Nominatim URL, so known queries can be looked up without any network access
+def import_osmnx_cache(queries, cache_folder="cache", path=GAZETTEER_PATH):
+    entries = {}
+    for query in queries:
+        params = urlencode({"format": "json", "limit": 1, "dedupe": 0, "q": query})
+        url = f"https://nominatim.openstreetmap.org/search?{params}"
+        cache_file = os.path.join(cache_folder, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+        if os.path.exists(cache_file):
+            with open(cache_file, encoding='utf-8') as f:
+                response = json.load(f)
+            if response:
+                entries[query] = (float(response[0]['lat']), float(response[0]['lon']))
+    add_entries(entries, path)
+    return entries
+
+
+# ---------------------------------------------------Geocoding----------------------------------------------------------
+
+
+# Resolves many place names at once. Unknown names are geocoded online unless offline=True, in which case a
+# LookupError lists every name missing from the gazetteer
+def bulk_geocode(queries, offline=False, path=GAZETTEER_PATH):
+    gazetteer = load_gazetteer(path)
+    missing = list(dict.fromkeys(normalize_query(query) for query in queries
+                                 if normalize_query(query) not in gazetteer))
+    if missing:
+        if offline:
+            raise LookupError(f"{len(missing)} place name(s) not in gazetteer {path}: {missing}")
+        import osmnx as ox
+        add_entries({query: ox.geocode(query) for query in missing}, path)
+    return {query: gazetteer[normalize_query(query)] for query in queries}
+
+
+def geocode(query, offline=False, path=GAZETTEER_PATH):
+    return bulk_geocode([query], offline, path)[query]
+
+
+# Geocodes a locations dict {name: address} into {name: (lat, lon)}
+def geocode_all(locations, offline=False, path=GAZETTEER_PATH):
+    points = bulk_geocode(list(locations.values()), offline, path)
+    return {name: points[loc] for name, loc in locations.items()}
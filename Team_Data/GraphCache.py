@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import pickle
+
+# Persistent store for OSMnx road graphs. Every graph is saved once as a binary pickle (same format as
+# NetworkX_and_OSMNx/output/graph.pkl) under a file name derived from the query that built it, so later runs
+# and budget-sweep iterations load it from disk instead of downloading and parsing OSM data again.
+
+# Next to this module, so runs from any working directory share one cache
+cache_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_cache")
+
+# Graphs already loaded in this process, so repeated calls (e.g. per selected node) cost a dict lookup
+_loaded_graphs = {}
+
+
+# Content address of a graph query: sha1 of the normalised (place, dist, network_type) triple
+def graph_key(place, dist, network_type):
+    query = json.dumps({"place": place, "dist": dist, "network_type": network_type}, sort_keys=True)
+    return hashlib.sha1(query.encode("utf-8")).hexdigest()
+
+
+def graph_path(place, dist, network_type, folder=None):
+    return os.path.join(folder or cache_folder, graph_key(place, dist, network_type) + ".pkl")
+
+
+def save_graph(G, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write to a temporary file first so an interrupted run never leaves a truncated graph behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_graph(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+# Returns the drive network around an address, downloading it only if it is neither in memory nor on disk
+def get_graph(place="Munich, Germany", dist=5000, network_type='drive', folder=None, offline=False):
+    path = graph_path(place, dist, network_type, folder)
+    if path in _loaded_graphs:
+        return _loaded_graphs[path]
+
+    if os.path.exists(path):
+        G = load_graph(path)
+    elif offline:
+        raise FileNotFoundError(f"No cached graph for {place!r} (dist={dist}, network_type={network_type!r}) "
+                                f"at {path}")
+    else:
+        import osmnx as ox
+        G = ox.graph_from_address(place, network_type=network_type, dist=dist)
+        save_graph(G, path)
+
+    _loaded_graphs[path] = G
+    return G
+
+
+# Registers an existing graph pickle (e.g. NetworkX_and_OSMNx/output/graph.pkl) under the given query
+def import_graph(source_path, place, dist, network_type='drive', folder=None):
+    G = load_graph(source_path)
+    path = graph_path(place, dist, network_type, folder)
+    save_graph(G, path)
+    _loaded_graphs[path] = G
+    return path
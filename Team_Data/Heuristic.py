@@ -0,0 +1,307 @@
+import time
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+import MatrixModel
+import SparseParameters
+
+# Greedy heuristic for the flow-capturing model of Model.py. Path r is served by y_r = min(1, sum_k x_k / d_k) over
+# its nodes, so the value of extra modules can be read column by column from the sparse coverage matrix:
+#
+#   greedy        repeatedly buys the block of m modules at one node with the best covered flow per cost, where a
+#                 closed node costs FC + m * VC and an open one m * VC, until the budget or CAP stops it
+#   local search  moves single modules between nodes (opening and closing stations) while the objective improves
+#   LP bound      continuous relaxation of the same MatrixModel.Formulation (with the valid x <= CAP * z in place of
+#                 x <= M * z) solved with HiGHS, an upper bound on the MIP objective
+#
+# With a minimum service ratio the service shortfall of every path is filled first (greedily, or from the rounded LP
+# of the cheapest plan with full service where the greedy gets stuck) and only then the covered flow is maximised.
+# Plans that still miss the minimum service are reported as infeasible, without a gap. Everything runs on numpy/scipy,
+# so instances far beyond the MIP's reach take seconds.
+
+
+class Solution:
+
+    def __init__(self, nodes, modules, objective, cost, bound=None, runtime=0.0, feasible=True):
+        self.nodes = nodes
+        self.modules = modules
+        self.objective = objective
+        self.cost = cost
+        self.bound = bound
+        self.runtime = runtime
+        self.feasible = feasible
+
+    # Relative gap to the LP bound, defined like Gurobi's MIPGap (none for plans that miss the minimum service)
+    @property
+    def gap(self):
+        if self.bound is None or not self.feasible:
+            return float('nan')
+        return abs(self.bound - self.objective) / max(abs(self.objective), 1e-10)
+
+    # {k: modules} of all opened stations
+    def stations(self):
+        return {k: int(m) for k, m in zip(self.nodes.tolist(), self.modules.tolist()) if m > 0}
+
+
+class Instance:
+
+    def __init__(self, params, FC, VC, B, CAP, min_service=None):
+        self.params = params
+        self.FC, self.VC, self.B, self.CAP = float(FC), float(VC), float(B), int(CAP)
+        self.min_service = min_service
+        self.A = params.coverage_matrix().tocsc()
+        self.n_nodes = self.A.shape[1]
+        self.flows = params.flows
+        # Paths with negative flow (possible after the charging-flow offset) never add to the coverage value
+        self.weights = np.maximum(self.flows, 0)
+        self.lower = np.full(len(self.flows), float(min_service) if min_service is not None else 0.0)
+        # Column of every stored entry of the CSC matrix, for bincount over columns
+        self.entry_cols = np.repeat(np.arange(self.n_nodes), np.diff(self.A.indptr))
+
+    def coverage(self, modules):
+        return self.A @ modules
+
+    # The best y for given coverage: as high as possible on positive flows, at the lower bound on negative ones
+    def objective_from_coverage(self, coverage):
+        y = np.where(self.flows > 0, np.clip(coverage, 0, 1), self.lower)
+        return float(self.flows @ y)
+
+    def objective(self, modules):
+        return self.objective_from_coverage(self.coverage(modules))
+
+    def cost(self, modules):
+        return self.FC * np.count_nonzero(modules) + self.VC * modules.sum()
+
+    def service_feasible(self, modules):
+        return bool(np.all(np.minimum(self.coverage(modules), 1) >= self.lower - 1e-9))
+
+    # Weighted coverage (up to target) lost per node by removing one module there
+    def losses(self, coverage, target, weights):
+        rows = self.A.indices
+        target = np.broadcast_to(target, coverage.shape)[rows]
+        served = np.minimum(coverage[rows], target)
+        values = weights[rows] * (served - np.clip(coverage[rows] - self.A.data, 0, target))
+        return np.bincount(self.entry_cols, weights=values, minlength=self.n_nodes)
+
+    # Weighted coverage gained per node by adding `added` modules there, given the current coverage
+    def gains(self, coverage, target, weights, added=1):
+        rows = self.A.indices
+        slack = np.maximum(target - coverage, 0)
+        values = weights[rows] * np.minimum(slack[rows], added * self.A.data)
+        return np.bincount(self.entry_cols, weights=values, minlength=self.n_nodes)
+
+
+# ---------------------------------------------------Greedy and local search-------------------------------------------
+
+
+def greedy(instance, modules, target, weights):
+    while True:
+        coverage = instance.coverage(modules)
+        spent = instance.cost(modules)
+        closed = modules == 0
+        best_ratio, best_node, best_added = 1e-12, None, 0
+        for added in range(1, instance.CAP + 1):
+            cost = added * instance.VC + instance.FC * closed
+            allowed = (modules + added <= instance.CAP) & (spent + cost <= instance.B + 1e-9)
+            if not allowed.any():
+                continue
+            ratio = np.where(allowed, instance.gains(coverage, target, weights, added) / np.maximum(cost, 1e-12), 0)
+            node = int(np.argmax(ratio))
+            if ratio[node] > best_ratio:
+                best_ratio, best_node, best_added = ratio[node], node, added
+        if best_node is None:
+            return modules
+        modules[best_node] += best_added
+
+
+# Fills the service shortfall of a plan (if there is a minimum service ratio). The greedy spends on the paths with the
+# most shortfall per cost and can leave a few paths just short of the minimum; then the plan is merged with the
+# rounded cheapest-service LP and repaired against the budget. Returns the greedy plan if neither reaches the minimum
+def serve(instance, modules):
+    if instance.min_service is None:
+        return modules
+    served = greedy(instance, modules.copy(), instance.lower, np.ones(len(instance.flows)))
+    if instance.service_feasible(served):
+        return served
+    planned = service_plan(instance)
+    if planned is None:
+        return served
+    planned = repair(instance, np.maximum(modules, planned))
+    return planned if instance.service_feasible(planned) else served
+
+
+# Fills the service shortfall first (if there is a minimum service ratio), then maximises the covered flow
+def construct(instance):
+    modules = serve(instance, np.zeros(instance.n_nodes, dtype=np.int64))
+    return greedy(instance, modules, np.ones(len(instance.flows)), instance.weights)
+
+
+# Takes modules away until the plan fits the budget, each time the one with the least lost flow per saved cost.
+# Removals that push a path below the minimum service come last, the one with the least shortfall per saved cost first
+def repair(instance, modules):
+    while instance.cost(modules) > instance.B + 1e-9:
+        coverage = instance.coverage(modules)
+        saved = instance.VC + instance.FC * (modules == 1)
+        ratio = instance.losses(coverage, 1.0, instance.weights) / saved
+        candidates = modules > 0
+        if instance.min_service is not None:
+            shortfall = instance.losses(coverage, instance.lower, np.ones(len(instance.flows))) / saved
+            keeps_service = candidates & (shortfall <= 1e-12)
+            if keeps_service.any():
+                candidates = keeps_service
+            else:
+                ratio = shortfall
+        modules[int(np.argmin(np.where(candidates, ratio, np.inf)))] -= 1
+    return modules
+
+
+# Moves one module from node a to node b while that raises the objective, then spends any budget freed by closing a
+# station. candidates limits the exact checks per removed module to the best predicted moves
+def local_search(instance, modules, max_moves=1000, candidates=10):
+    objective = instance.objective(modules)
+    for _ in range(max_moves):
+        coverage = instance.coverage(modules)
+        move = None
+        for a in np.flatnonzero(modules).tolist():
+            reduced = modules.copy()
+            reduced[a] -= 1
+            reduced_coverage = coverage - instance.A[:, a].toarray().ravel()
+            loss = objective - instance.objective_from_coverage(reduced_coverage)
+            gain = instance.gains(reduced_coverage, 1.0, instance.weights)
+            cost = instance.VC + instance.FC * (reduced == 0)
+            allowed = (reduced + 1 <= instance.CAP) & (instance.cost(reduced) + cost <= instance.B + 1e-9)
+            allowed[a] = False
+            improvement = np.where(allowed, gain - loss, 0)
+            for b in np.argsort(-improvement)[:candidates].tolist():
+                if improvement[b] <= 1e-9:
+                    break
+                trial = reduced.copy()
+                trial[b] += 1
+                trial_objective = instance.objective(trial)
+                if trial_objective > objective + 1e-9 and instance.service_feasible(trial):
+                    move = trial
+                    break
+            if move is not None:
+                break
+        if move is None:
+            return modules
+        modules = greedy(instance, move, np.ones(len(instance.flows)), instance.weights)
+        objective = instance.objective(modules)
+    return modules
+
+
+# ---------------------------------------------------LP bound-----------------------------------------------------------
+
+
+# Optimal value, solution [y | x | z] and row duals of the LP relaxation of a MatrixModel.Formulation (three times None
+# if the LP is infeasible). The duals are in row order of formulation.A and give the change of the optimum per unit of
+# right-hand side, so they are <= 0 on binding Proportion_Refueled rows. HiGHS' interior point method with crossover;
+# dual simplex stalls on the highly degenerate coverage rows
+def solve_lp(formulation):
+    upper = formulation.sense == '<'
+    A_ub = sp.vstack([formulation.A[upper], -formulation.A[~upper]], format='csr')
+    b_ub = np.concatenate([formulation.rhs[upper], -formulation.rhs[~upper]])
+    result = linprog(-formulation.c, A_ub=A_ub, b_ub=b_ub, bounds=np.column_stack([formulation.lb, formulation.ub]),
+                     method='highs-ipm')
+    if result.status != 0:
+        return None, None, None
+    # linprog minimises -c with all rows as <=: flip the marginals back to the maximisation and the original rows
+    marginals = result.ineqlin.marginals
+    duals = np.empty(len(formulation.rhs))
+    duals[np.flatnonzero(upper)] = -marginals[:np.count_nonzero(upper)]
+    duals[np.flatnonzero(~upper)] = marginals[np.count_nonzero(upper):]
+    return -result.fun, result.x, duals
+
+
+def lp_bound(formulation):
+    return solve_lp(formulation)[0]
+
+
+# Modules of the LP relaxation of the cheapest plan with the minimum service on every path, rounded up (None if the
+# minimum service is out of reach within the budget even for the LP)
+def service_plan(instance):
+    formulation = tight_formulation(instance.params, instance.FC, instance.VC, instance.B, instance.CAP,
+                                    instance.min_service)
+    formulation.c = np.zeros(len(formulation.c))
+    formulation.c[formulation.x] = -instance.VC
+    formulation.c[formulation.z] = -instance.FC
+    _, values, _ = solve_lp(formulation)
+    if values is None:
+        return None
+    return np.minimum(np.ceil(values[formulation.x] - 1e-6), instance.CAP).astype(np.int64)
+
+
+# The MIP with the valid x <= CAP * z and y_r <= sum_k min(1, CAP / d_k) z_k (a station adds at most CAP / d_k to the
+# coverage of a path): same integer solutions, much tighter relaxation than with a big M
+def tight_formulation(params, FC, VC, B, CAP, min_service=None):
+    formulation = MatrixModel.Formulation(params, FC, VC, B, CAP, CAP, min_service)
+    station_coverage = params.coverage_matrix() * CAP
+    station_coverage.data = np.minimum(station_coverage.data, 1)
+    rows = sp.hstack([-sp.identity(formulation.n_paths), sp.csr_matrix((formulation.n_paths, formulation.n_nodes)),
+                      station_coverage])
+    start = formulation.A.shape[0]
+    formulation.row_blocks["Station coverage"] = slice(start, start + formulation.n_paths)
+    formulation.A = sp.vstack([formulation.A, rows], format='csr')
+    formulation.sense = np.concatenate([formulation.sense, np.full(formulation.n_paths, '>')])
+    formulation.rhs = np.concatenate([formulation.rhs, np.zeros(formulation.n_paths)])
+    return formulation
+
+
+# ---------------------------------------------------Entry points-------------------------------------------------------
+
+
+# Heuristic solution for a SparseParameters instance, with the LP bound unless bound=False
+def solve(params, FC, VC, B, CAP, min_service=None, improve=True, bound=True):
+    start = time.perf_counter()
+    instance = Instance(params, FC, VC, B, CAP, min_service)
+    modules = construct(instance)
+    if improve:
+        modules = local_search(instance, modules)
+    upper_bound = lp_bound(tight_formulation(params, FC, VC, B, CAP, min_service)) if bound else None
+    return Solution(params.nodes, modules, instance.objective(modules), instance.cost(modules), upper_bound,
+                    time.perf_counter() - start, instance.service_feasible(modules))
+
+
+# Relax-and-round: solves the LP relaxation, rounds its modules up, repairs the plan against the budget and spends what
+# is left with the greedy. Rounding up keeps every node the LP uses as candidate; the repair then drops the least
+# valuable modules. The better of the rounded and the plain greedy plan is polished by the local search, and the LP
+# value certifies its gap
+def solve_relaxed(params, FC, VC, B, CAP, min_service=None, improve=True):
+    start = time.perf_counter()
+    instance = Instance(params, FC, VC, B, CAP, min_service)
+    formulation = tight_formulation(params, FC, VC, B, CAP, min_service)
+    bound, values, _ = solve_lp(formulation)
+
+    plans = [construct(instance)]
+    if values is not None:
+        modules = repair(instance, np.minimum(np.ceil(values[formulation.x] - 1e-6), CAP).astype(np.int64))
+        modules = serve(instance, modules)
+        plans.append(greedy(instance, modules, np.ones(len(instance.flows)), instance.weights))
+    modules = max(plans, key=lambda plan: (instance.service_feasible(plan), instance.objective(plan)))
+    if improve:
+        modules = local_search(instance, modules)
+    return Solution(params.nodes, modules, instance.objective(modules), instance.cost(modules), bound,
+                    time.perf_counter() - start, instance.service_feasible(modules))
+
+
+# SparseParameters straight from the dicts of get_parameters (P=None) or get_parameters_extended (every OD-pair with
+# its own paths, an OD-pair may have fewer than P)
+def parameters(Q, K, N, f, d_k, P=None):
+    if P is None:
+        return SparseParameters.SparseParameters.from_routes({q: N[q] for q in Q}, f, nodes=K, d_k=d_k)
+    return SparseParameters.SparseParameters.from_paths({q: dict(N[q]) for q in Q}, f, nodes=K, d_k=d_k)
+
+
+# Heuristic solution for a Model.Model
+def solve_model(model, improve=True, bound=True):
+    return solve(model.sparse_parameters(), model.FC, model.VC, model.B, model.CAP, model.min_service, improve, bound)
+
+
+# Passes the solution to the built Gurobi model of a Model.Model (after model.build) as MIP start. Nodes without
+# variables (removed by the presolve) are left out
+def mip_start(model, solution):
+    for k, modules in zip(solution.nodes.tolist(), solution.modules.tolist()):
+        if k not in model.x:
+            continue
+        model.x[k].Start = modules
+        model.z[k].Start = 1 if modules > 0 else 0
@@ -0,0 +1,180 @@
+import heapq
+import os
+import numpy as np
+import networkx as nx
+from scipy.sparse.csgraph import dijkstra
+import GraphCache
+import Routing
+
+# Landmark (ALT) routing index for repeated point-to-point queries on the static road graph. A few landmarks on the
+# edge of the network are chosen once (farthest-point selection) and the distances from and to every landmark are
+# stored for all nodes. By the triangle inequality
+#
+#   d(v, t) >= max_L max(d(L, t) - d(L, v), d(v, L) - d(t, L))
+#
+# which is a consistent A* heuristic that points the search straight at the target, so a query settles a small part
+# of the graph. The index is built from the CSR graph (Routing.CsrGraph) and saved as .alt.npz next to the cached
+# graph pickle, together with the number of landmarks, the edge weight and the modification time of the graph pickle
+# it was built from; an index that does not match them is rebuilt. Distances are stored as float32; paths are optimal
+# up to that rounding (millimetres at city scale).
+
+# Indexes already loaded in this process: {(path, n_landmarks, weight, graph_mtime): index}
+_loaded_indexes = {}
+
+
+class LandmarkIndex:
+
+    def __init__(self, csr, landmarks, from_landmarks, to_landmarks, n_landmarks=None, graph_mtime=None):
+        self.csr = csr
+        self.landmarks = landmarks
+        # Landmarks asked for (more than the graph has nodes gives fewer) and mtime_ns of the source graph pickle
+        self.n_landmarks = n_landmarks if n_landmarks is not None else len(landmarks)
+        self.graph_mtime = graph_mtime
+        # (nodes x landmarks): d(L, v) and d(v, L), row per node for fast per-node lookups
+        self.from_landmarks = from_landmarks
+        self.to_landmarks = to_landmarks
+        self._adjacency = None
+
+    @classmethod
+    def build(cls, G, n_landmarks=16, weight='length', seed=0):
+        csr = G if isinstance(G, Routing.CsrGraph) else Routing.CsrGraph(G, weight)
+        n = len(csr.nodes)
+        n_landmarks = min(n_landmarks, n)
+        rng = np.random.default_rng(seed)
+
+        # Farthest-point selection: start at the node farthest from a random one, then always add the node farthest
+        # from all landmarks chosen so far (unreachable nodes are skipped)
+        start = dijkstra(csr.matrix, directed=True, indices=int(rng.integers(n)))
+        current = int(np.argmax(np.where(np.isfinite(start), start, -1)))
+        landmarks, rows = [], []
+        closest = np.full(n, np.inf)
+        for _ in range(n_landmarks):
+            landmarks.append(current)
+            row = dijkstra(csr.matrix, directed=True, indices=current)
+            rows.append(row)
+            closest = np.minimum(closest, np.where(np.isfinite(row), row, np.inf))
+            candidates = np.where(np.isfinite(closest), closest, -1)
+            candidates[landmarks] = -1
+            current = int(np.argmax(candidates))
+
+        landmarks = np.array(landmarks)
+        from_landmarks = np.ascontiguousarray(np.array(rows, dtype=np.float32).T)
+        to_landmarks = np.ascontiguousarray(
+            dijkstra(csr.matrix.T.tocsr(), directed=True, indices=landmarks).astype(np.float32).T)
+        return cls(csr, landmarks, from_landmarks, to_landmarks, n_landmarks)
+
+    # ---------------------------------------------------Files----------------------------------------------------------
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        matrix = self.csr.matrix
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, nodes=self.csr.nodes, indptr=matrix.indptr, indices=matrix.indices,
+                            data=matrix.data, weight=np.array(self.csr.weight), landmarks=self.landmarks,
+                            from_landmarks=self.from_landmarks, to_landmarks=self.to_landmarks,
+                            n_landmarks=np.array(self.n_landmarks),
+                            graph_mtime=np.array(-1 if self.graph_mtime is None else self.graph_mtime, dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            csr = Routing.CsrGraph.from_arrays(data['nodes'], data['indptr'], data['indices'], data['data'],
+                                               str(data['weight']))
+            # Files without the settings (older indexes) never match and are rebuilt by get_index
+            n_landmarks = int(data['n_landmarks']) if 'n_landmarks' in data.files else -1
+            graph_mtime = int(data['graph_mtime']) if 'graph_mtime' in data.files else -1
+            return cls(csr, data['landmarks'], data['from_landmarks'], data['to_landmarks'], n_landmarks,
+                       None if graph_mtime < 0 else graph_mtime)
+
+    # Built with these settings from the graph pickle with this modification time
+    def matches(self, n_landmarks, weight, graph_mtime):
+        return self.n_landmarks == n_landmarks and self.csr.weight == weight and self.graph_mtime == graph_mtime
+
+    # ---------------------------------------------------Queries--------------------------------------------------------
+
+    # Lower bound on the distance from matrix index v to the target's landmark distances
+    def bound(self, v, from_target, to_target):
+        with np.errstate(invalid='ignore'):
+            lower = np.fmax.reduce(np.concatenate((from_target - self.from_landmarks[v],
+                                                   self.to_landmarks[v] - to_target)))
+        return max(0.0, float(lower))  # nan (no landmark reaches either node) gives no bound
+
+    # A* from source to target (node ids). Returns (path, length); raises NetworkXNoPath if there is none
+    def shortest_path(self, source, target):
+        if self._adjacency is None:
+            matrix = self.csr.matrix
+            self._adjacency = (matrix.indptr.tolist(), matrix.indices.tolist(), matrix.data.tolist())
+        indptr, indices, data = self._adjacency
+        s, t = self.csr.index([source, target]).tolist()
+        from_target, to_target = self.from_landmarks[t], self.to_landmarks[t]
+
+        distance = {s: 0.0}
+        parent = {s: -1}
+        settled = set()
+        heap = [(self.bound(s, from_target, to_target), 0.0, s)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            if u == t:
+                path = [u]
+                while parent[path[-1]] >= 0:
+                    path.append(parent[path[-1]])
+                return self.csr.nodes[path[::-1]].tolist(), d
+            settled.add(u)
+            for j in range(indptr[u], indptr[u + 1]):
+                v = indices[j]
+                candidate = d + data[j]
+                if candidate < distance.get(v, np.inf):
+                    distance[v] = candidate
+                    parent[v] = u
+                    estimate = self.bound(v, from_target, to_target)
+                    if estimate != np.inf:
+                        heapq.heappush(heap, (candidate + estimate, candidate, v))
+        raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+
+    def shortest_path_length(self, source, target):
+        return self.shortest_path(source, target)[1]
+
+    # Same interface as Routing.CsrGraph.shortest_paths, so the index can be passed to Routing.route_od_pairs
+    def shortest_paths(self, targets):
+        results = {}
+        for origin, origin_targets in targets.items():
+            results[origin] = {}
+            for target in origin_targets:
+                try:
+                    results[origin][target] = self.shortest_path(origin, target)
+                except nx.NetworkXNoPath:
+                    pass
+        return results
+
+
+def index_path(place, dist, network_type='drive', folder=None):
+    return os.path.splitext(GraphCache.graph_path(place, dist, network_type, folder))[0] + ".alt.npz"
+
+
+def graph_mtime(place, dist, network_type='drive', folder=None):
+    graph_file = GraphCache.graph_path(place, dist, network_type, folder)
+    return os.stat(graph_file).st_mtime_ns if os.path.exists(graph_file) else None
+
+
+# Landmark index of a cached graph: loaded from disk if it was built before with the same number of landmarks and edge
+# weight from the current graph pickle, otherwise built and saved (e.g. after GraphCache.import_graph replaced it)
+def get_index(place="Munich, Germany", dist=5000, network_type='drive', folder=None, n_landmarks=16, weight='length',
+              offline=False):
+    path = index_path(place, dist, network_type, folder)
+    key = (path, n_landmarks, weight, graph_mtime(place, dist, network_type, folder))
+    if key in _loaded_indexes:
+        return _loaded_indexes[key]
+
+    index = LandmarkIndex.load(path) if os.path.exists(path) else None
+    if index is None or key[3] is None or not index.matches(n_landmarks, weight, key[3]):
+        G = GraphCache.get_graph(place, dist, network_type, folder, offline)
+        index = LandmarkIndex.build(G, n_landmarks, weight)
+        index.graph_mtime = graph_mtime(place, dist, network_type, folder)
+        index.save(path)
+        key = (path, n_landmarks, weight, index.graph_mtime)
+
+    _loaded_indexes[key] = index
+    return index
@@ -1,10 +1,11 @@
-# We run the code in here
+# We run the code in here (the same workflows run from the command line with Cli.py)
 import warnings
 import DataGenerationAndProcessing as data
 import DataGenerationAndProcessingExtended as extendedData
 import Model
-import Visualize
-import matplotlib.pyplot as plt
+
+# The other modules (e.g. Sweep, SolverBackend, matplotlib, Visualize) are imported in the blocks that use them, so a
+# model run loads none of them
 
 if __name__ == '__main__':
     FC = 21  # Fixed charging station installation cost
@@ -19,42 +20,38 @@ if __name__ == '__main__':
     annual_trips = data.get_flows(coords, routes_length)
     Q, K, N_q, f_q, d_k = data.get_parameters(routes_nodes, G, annual_trips)
     base_model = Model.Model(FC, VC, B, CAP, M, Q, K, N_q, f_q, d_k, coords, routes_nodes, routes_length, G, False)
+
+    # Uncomment to store the parameters, so later runs can solve from the bundle without any data generation
+    #import ParameterBundle
+    #ParameterBundle.ParameterBundle.from_base(Q, K, N_q, f_q, d_k, G).save("parameters_base.npz")
+
     base_model.run()
+    #import Visualize
     #base_model_visualize = Visualize.Visualize()
     #base_model_visualize.base_model_map(G, routes_nodes)
     """
 
     # Please uncomment this block to run a Budget Iteration of the Base model
     """
+    import Sweep
+
     Iterations = range(6)
     Initial_budget = 10000
     Budget_steps = 1000
 
-    B = Initial_budget
-    
-    budget_values = []
-    objective_values = []
-    
     coords, routes_nodes, routes_length, G = data.get_routes()
     annual_trips = data.get_flows(coords, routes_length)
     Q, K, N_q, f_q, d_k = data.get_parameters(routes_nodes, G, annual_trips)
-    
-    for i in Iterations:
-        print("ITERATION", i, "BUDGET", B)
-    
-        base_model = Model.Model(FC, VC, B, CAP, M, Q, K, N_q, f_q, d_k, coords, routes_nodes, routes_length, G, False)
-        objective = base_model.run()
-        #base_model_visualize = Visualize.Visualize()
-        #base_model_visualize.base_model_map(G, routes_nodes)
-    
-        
-    
-        budget_values.append(B / 1000)
-        objective_values.append(objective)
-    
-        B += Budget_steps
+
+    # The model is built once; each iteration only changes the budget and starts from the previous solution
+    base_model = Model.Model(FC, VC, Initial_budget, CAP, M, Q, K, N_q, f_q, d_k, coords, routes_nodes, routes_length, G, False)
+    results = Sweep.budget_sweep(base_model, [Initial_budget + i * Budget_steps for i in Iterations])
+
+    budget_values = list(results["budget"] / 1000)
+    objective_values = list(results["objective"])
 
     # Plotting the graph
+    import matplotlib.pyplot as plt
     plt.plot(budget_values, objective_values, marker='o')
     plt.xlabel('Budget in $ Mio')
     plt.ylabel('Flow covered/ 30 min')
@@ -70,44 +67,49 @@ if __name__ == '__main__':
     Q, P, K, N_qp, f_q, f_qp, d_k = extendedData.get_parameters_extended(routes_nodes, annual_trips, routes_length, G)
     model = Model.Model(FC, VC, B, CAP, M, Q, K, N_qp, f_qp, d_k, coords, routes_nodes, routes_length, G, True)
 
+    # Uncomment to store the parameters, so later runs can solve from the bundle without any data generation
+    #import ParameterBundle
+    #ParameterBundle.ParameterBundle.from_extended(Q, P, K, N_qp, f_qp, d_k, G).save("parameters_extended.npz")
+
+    #import Visualize
     #model_path = Visualize.Visualize()
     #model_path.paths(G, routes_nodes)  # initial visualization of paths on the map
 
     model.run()
 
+    #import Visualize
     #after_model = Visualize.Visualize(model.result_locations)
     #after_model.where_to_install(G)  # result location shown on the map
 
 
+    # Please uncomment this block to run the Extended model from a stored parameter bundle
+    """
+    import ParameterBundle
+
+    bundle = ParameterBundle.ParameterBundle.load("parameters_extended.npz")
+    model = Model.Model.from_bundle(bundle, FC, VC, B, CAP, M)
+    model.run()
+    """
+
     # Please uncomment this block to run a Budget Iteration of the Extended model
     """
+    import Sweep
+
     Iterations = range(25)
     Initial_budget = 31000
     Budget_steps = 1000
 
-    B = Initial_budget
-
-    budget_values = []
-    objective_values = []
-    gaps = []
-
     coords, routes_nodes, routes_length, G = extendedData.get_routesandpaths()
     annual_trips = data.get_flows(coords, routes_length)
     Q, P, K, N_qp, f_q, f_qp, d_k = extendedData.get_parameters_extended(routes_nodes, annual_trips, routes_length, G)
 
+    # The model is built once; each iteration only changes the budget and starts from the previous solution
+    model = Model.Model(FC, VC, Initial_budget, CAP, M, Q, K, N_qp, f_qp, d_k, coords, routes_nodes, routes_length, G, True)
+    results = Sweep.budget_sweep(model, [Initial_budget + i * Budget_steps for i in Iterations])
 
-    for i in Iterations:
-        print("ITERATION", i, "BUDGET", B)
-
-        model = Model.Model(FC, VC, B, CAP, M, Q, K, N_qp, f_qp, d_k, coords, routes_nodes, routes_length, G, True)
-        objective, gap = model.run()
-
-        budget_values.append(B / 1000)
-        objective_values.append(objective)
-        gaps.append(gap)
-
-        B += Budget_steps
-
+    budget_values = list(results["budget"] / 1000)
+    objective_values = list(results["objective"])
+    gaps = list(results["gap"])
 
     #printing the outputs
     print(budget_values)
@@ -115,10 +117,93 @@ if __name__ == '__main__':
     print(gaps)
 
     # Plotting the graph
+    import matplotlib.pyplot as plt
     plt.plot(budget_values, objective_values, marker='o')
     plt.xlabel('Budget in $ Mio')
     plt.ylabel('Flow covered/ 30 min')
     plt.title('Objective Value related to Budget')
     plt.grid(True)
     plt.show()
-    """
\ No newline at end of file
+    """
+
+    # Please uncomment this block to run a parallel scenario sweep over budget, module cap, costs and minimum service
+    # ratio on a stored parameter bundle (rerunning it resumes from scenarios.csv)
+    """
+    import Sweep
+
+    scenarios = Sweep.scenario_grid(B=range(25000, 41000, 1000), CAP=[4, 6, 8], FC=[21], VC=[20], min_service=[0.3, 0.4])
+    results = Sweep.run_scenarios("parameters_extended.npz", scenarios, "scenarios.csv", parquet_path="scenarios.parquet")
+    print(results)
+    """
+
+    # Please uncomment this block to trace the coverage-vs-budget curve of the stored extended bundle with adaptively
+    # placed budgets instead of a fixed step
+    """
+    import ParameterBundle
+    import Sweep
+
+    bundle = ParameterBundle.ParameterBundle.load("parameters_extended.npz")
+    model = Model.Model.from_bundle(bundle, FC=21, VC=20, B=25000, CAP=6, M=999999)
+    results = Sweep.budget_frontier(model, 25000, 45000, min_step=1000)
+    print(results)
+    import matplotlib.pyplot as plt
+    plt.plot(results["budget"] / 1000, results["objective"], marker='o')
+    plt.xlabel('Budget in $ Mio')
+    plt.ylabel('Flow covered/ 30 min')
+    plt.title('Objective Value related to Budget')
+    plt.grid(True)
+    plt.show()
+    """
+
+    # Please uncomment this block to compare the Gurobi and the open-source HiGHS backend on the stored bundles
+    """
+    import ParameterBundle
+    import SolverBackend
+
+    instances = {
+        "base": SolverBackend.formulation(ParameterBundle.ParameterBundle.load("parameters_base.npz"), 21, 20, 25000, 6, 999999),
+        "extended": SolverBackend.formulation(ParameterBundle.ParameterBundle.load("parameters_extended.npz"), 21, 20, 31000, 6, 999999, 0.4),
+    }
+    print(SolverBackend.benchmark(instances))
+    """
+
+    # Please uncomment this block to solve the stored extended bundle by Lagrangian decomposition of the budget over
+    # the independent OD groups, one worker process per group
+    """
+    import ParameterBundle
+
+    bundle = ParameterBundle.ParameterBundle.load("parameters_extended.npz")
+    model = Model.Model.from_bundle(bundle, FC, VC, B, CAP, M)
+    model.run_decomposed()
+    """
+
+    # Please uncomment this block to generate alternative paths by column generation, starting from the shortest paths
+    # of the base model (nodes off its routes get the demand of the paths through them)
+    """
+    import ColumnGeneration
+
+    coords, routes_nodes, routes_length, G = data.get_routes()
+    annual_trips = data.get_flows(coords, routes_length)
+    Q, K, N_q, f_q, d_k = data.get_parameters(routes_nodes, G, annual_trips)
+    paths = ColumnGeneration.ColumnGeneration(G, routes_nodes, routes_length, f_q, FC, VC, B, CAP, d_k=d_k)
+    N_qp, f_qp = paths.run(rounds=10, max_paths=5)
+    model = Model.Model.from_bundle(paths.to_bundle(), FC, VC, B, CAP, M, G=G)
+    model.run(use_matrix_api=True)
+    """
+
+    # Please uncomment this block to write the station map of every budget of the stored extended bundle to PNG files
+    # without a display (the road graph is drawn once and every map only adds its stations)
+    """
+    import GraphCache
+    import MapRenderer
+    import ParameterBundle
+    import SolverBackend
+
+    bundle = ParameterBundle.ParameterBundle.load("parameters_extended.npz")
+    G = GraphCache.get_graph("Munich, Germany", dist=5000, network_type='drive')
+    maps = {}
+    for budget in range(25000, 41000, 1000):
+        result = SolverBackend.get_backend("highs").solve(SolverBackend.formulation(bundle, FC, VC, budget, CAP, M, 0.4))
+        maps[f"stations_{budget}.png"] = {"points": [bundle.node_coordinates[k] for k in result.stations()]}
+    MapRenderer.get_renderer(G, node_size=15).render_batch(maps)
+    """
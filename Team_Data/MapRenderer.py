@@ -0,0 +1,212 @@
+import inspect
+import os
+from multiprocessing import Pool
+import numpy as np
+from matplotlib.collections import LineCollection
+
+# Fast map rendering of the road graph. The edge geometries (OSMnx 'geometry' linestrings where present, otherwise the
+# straight line between the end nodes) are collected once per graph, and the whole network is drawn as a single
+# LineCollection. Routes become one LineCollection that follows the edge geometries and stations / parking lots one
+# scatter call, however many there are. Headless maps are drawn on an Agg canvas without pyplot: the canvas with the
+# network is rasterised once and every further map only restores that background and draws its own routes and points
+# on top, so batches of scenario maps cost little more than writing the image files (RGB, fast PNG compression).
+# Large batches are split over worker processes; each gets the edge geometry (a renderer pickles without its figures,
+# so this works with the spawn start method too) and rasterises the network once. The style follows ox.plot_graph.
+
+# Renderers already built in this process: {(id(G), style): (G, renderer)}
+_renderers = {}
+
+
+class MapRenderer:
+
+    def __init__(self, G, figsize=(12, 12), dpi=150, bgcolor='#111111', edge_color='#999999', edge_linewidth=1,
+                 node_color='w', node_size=0, weight='length'):
+        self.figsize = figsize
+        self.dpi = dpi
+        self.bgcolor = bgcolor
+        self.edge_color = edge_color
+        self.edge_linewidth = edge_linewidth
+        self.node_color = node_color
+        self.node_size = node_size
+
+        nodes = list(G.nodes)
+        self.index = {node: i for i, node in enumerate(nodes)}
+        self.node_xy = np.array([(G.nodes[node]['x'], G.nodes[node]['y']) for node in nodes], dtype=float)
+
+        # All edge segments for the network and, per (u, v), the coordinates of the lightest edge for routes
+        self.edge_segments = []
+        self.edge_xy = {}
+        lightest = {}
+        for u, v, data in G.edges(data=True):
+            if 'geometry' in data:
+                coordinates = np.asarray(data['geometry'].coords, dtype=float)
+            else:
+                coordinates = self.node_xy[[self.index[u], self.index[v]]]
+            self.edge_segments.append(coordinates)
+            length = data.get(weight, np.inf)
+            if (u, v) not in lightest or length < lightest[u, v]:
+                lightest[u, v] = length
+                self.edge_xy[u, v] = coordinates
+
+        low, high = self.node_xy.min(axis=0), self.node_xy.max(axis=0)
+        margin = 0.02 * (high - low)
+        self.xlim = (low[0] - margin[0], high[0] + margin[0])
+        self.ylim = (low[1] - margin[1], high[1] + margin[1])
+        # Unprojected graphs (degrees) are drawn with the local aspect ratio, like OSMnx does
+        crs = str(G.graph.get('crs', 'EPSG:4326')).lower()
+        self.aspect = 1 / np.cos(np.radians(self.node_xy[:, 1].mean())) if crs in ('epsg:4326', '+init=epsg:4326') \
+            else 1
+
+        self._axes = {}
+        self._background = None
+
+    # Pickled without the figures and the rasterised network, which are rebuilt on first use
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_axes={}, _background=None)
+        return state
+
+    # ---------------------------------------------------Figures--------------------------------------------------------
+
+    # Figure and axes with the network drawn, built once: headless on an Agg canvas, otherwise as a pyplot figure
+    # (rebuilt when it was closed)
+    def axes(self, headless=True):
+        cached = self._axes.get(headless)
+        if cached is not None:
+            if headless:
+                return cached
+            import matplotlib.pyplot as plt
+            if plt.fignum_exists(cached[0].number):
+                return cached
+
+        if headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            figure = Figure(figsize=self.figsize, dpi=self.dpi, facecolor=self.bgcolor)
+            FigureCanvasAgg(figure)
+        else:
+            import matplotlib.pyplot as plt
+            figure = plt.figure(figsize=self.figsize, dpi=self.dpi, facecolor=self.bgcolor)
+
+        ax = figure.add_axes([0, 0, 1, 1])
+        ax.set_facecolor(self.bgcolor)
+        ax.add_collection(LineCollection(self.edge_segments, colors=self.edge_color, linewidths=self.edge_linewidth,
+                                         zorder=1))
+        if self.node_size:
+            ax.scatter(self.node_xy[:, 0], self.node_xy[:, 1], s=self.node_size, c=self.node_color, linewidths=0,
+                       zorder=2)
+        ax.set_xlim(*self.xlim)
+        ax.set_ylim(*self.ylim)
+        ax.set_aspect(self.aspect)
+        ax.axis('off')
+
+        self._axes[headless] = (figure, ax)
+        if headless:
+            self._background = None
+        return figure, ax
+
+    # ---------------------------------------------------Overlays-------------------------------------------------------
+
+    # Coordinates of a route (list of nodes) along the edge geometries; consecutive nodes without an edge between them
+    # (e.g. after the parking filter) are joined by a straight line
+    def route_xy(self, route):
+        parts = []
+        for u, v in zip(route[:-1], route[1:]):
+            if (u, v) in self.edge_xy:
+                parts.append(self.edge_xy[u, v])
+            elif (v, u) in self.edge_xy:
+                parts.append(self.edge_xy[v, u][::-1])
+            else:
+                parts.append(self.node_xy[[self.index[u], self.index[v]]])
+        if not parts:
+            return self.node_xy[[self.index[node] for node in route]]
+        return np.concatenate([parts[0]] + [part[1:] for part in parts[1:]])
+
+    # Draws routes (node lists, one LineCollection, one colour or a colour per route) and points ((x, y), one scatter,
+    # sizes may be an array, e.g. by modules) over the network. Empty routes are skipped together with their colours.
+    # Returns the figure, the axes and the added artists
+    def draw(self, routes=(), route_colors='r', route_linewidth=4, route_alpha=0.5, points=None, point_color='red',
+             point_size=100, point_alpha=0.7, headless=True):
+        from matplotlib.colors import is_color_like
+
+        figure, ax = self.axes(headless)
+        artists = []
+        routes = list(routes)
+        kept = [i for i, route in enumerate(routes) if len(route) > 0]
+        if not is_color_like(route_colors):
+            route_colors = [route_colors[i] for i in kept]
+        routes = [routes[i] for i in kept]
+        if routes:
+            collection = LineCollection([self.route_xy(route) for route in routes], colors=route_colors,
+                                        linewidths=route_linewidth, alpha=route_alpha, zorder=3)
+            artists.append(ax.add_collection(collection))
+        if points is not None and len(points) > 0:
+            xy = np.asarray(points, dtype=float).reshape(-1, 2)
+            artists.append(ax.scatter(xy[:, 0], xy[:, 1], s=point_size, c=point_color, alpha=point_alpha,
+                                      linewidths=0, zorder=5))
+        return figure, ax, artists
+
+    # ---------------------------------------------------Headless rendering---------------------------------------------
+
+    # Headless canvas with the network rasterised once
+    def background(self):
+        figure, ax = self.axes(headless=True)
+        if self._background is None:
+            figure.canvas.draw()
+            self._background = figure.canvas.copy_from_bbox(figure.bbox)
+        return figure.canvas, self._background
+
+    # Writes one map with the given overlay (keyword arguments of draw) to path. Only the overlay is drawn, onto the
+    # cached raster of the network, and it is removed again afterwards
+    def render(self, path, **overlay):
+        from PIL import Image
+
+        canvas, background = self.background()
+        figure, ax, artists = self.draw(headless=True, **overlay)
+        try:
+            canvas.restore_region(background)
+            for artist in artists:
+                ax.draw_artist(artist)
+            image = Image.frombuffer('RGBA', canvas.get_width_height(physical=True), canvas.buffer_rgba(), 'raw',
+                                     'RGBA', 0, 1).convert('RGB')
+            image.save(path, **({"compress_level": 1} if path.lower().endswith(".png") else {}))
+        finally:
+            for artist in artists:
+                artist.remove()
+        return path
+
+    # Renders one map per entry of maps ({path: overlay}), e.g. the stations of every scenario of a sweep, on up to
+    # processes worker processes (all cores by default, small batches stay in this process)
+    def render_batch(self, maps, processes=None, min_maps_per_process=8):
+        processes = min(processes or os.cpu_count() or 1, len(maps) // min_maps_per_process)
+        if processes <= 1:
+            return [self.render(path, **overlay) for path, overlay in maps.items()]
+        with Pool(processes, initializer=_init_worker, initargs=(self,)) as pool:
+            return pool.map(_render, list(maps.items()))
+
+
+# Renderer of a worker process, rebuilt from the pickled edge geometry
+_worker_renderer = None
+
+
+def _init_worker(renderer):
+    global _worker_renderer
+    _worker_renderer = renderer
+    renderer.background()
+
+
+def _render(task):
+    path, overlay = task
+    return _worker_renderer.render(path, **overlay)
+
+
+# Renderer of G with the given style, built on first use and shared afterwards
+def get_renderer(G, **style):
+    defaults = {name: parameter.default for name, parameter in inspect.signature(MapRenderer).parameters.items()
+                if parameter.default is not inspect.Parameter.empty}
+    key = (id(G), tuple(sorted({**defaults, **style}.items())))
+    cached = _renderers.get(key)
+    if cached is None or cached[0] is not G:
+        cached = (G, MapRenderer(G, **style))
+        _renderers[key] = cached
+    return cached[1]
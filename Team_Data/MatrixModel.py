@@ -0,0 +1,113 @@
+import numpy as np
+import scipy.sparse as sp
+
+# The flow-capturing model of Model.create_model in sparse matrix form. Variables are ordered [y | x | z] with one y
+# per path (OD-pair q in the base model, (q, p) in the extended model) and one x and z per candidate node k:
+#
+#   max  f' y
+#   s.t. Proportion_Refueled            sum_k x[k] / d_k - y >= 0   for every path
+#        Budget_Constraint              FC * sum z + VC * sum x <= B
+#        Module_Capacity                x - M z <= 0
+#        Cap on modules at one station  x <= CAP
+#        Minimum service ratio          y >= min_service           (optional)
+#
+# The same Formulation feeds the Gurobi matrix-API builder below and any other solver that reads sparse matrices.
+
+# Minimum service ratio of the extended model when none is given (the base model has none); 0 lifts it
+EXTENDED_MIN_SERVICE = 0.4
+
+
+# The minimum service ratio a model uses: the given one, or for None the default of the base or extended model
+def min_service_for(min_service, is_extended):
+    if min_service is None:
+        return EXTENDED_MIN_SERVICE if is_extended else None
+    return min_service
+
+
+class Formulation:
+
+    def __init__(self, params, FC, VC, B, CAP, M, min_service=None):
+        self.params = params
+        self.n_paths = len(params.path_keys)
+        self.n_nodes = len(params.nodes)
+        n_paths, n_nodes = self.n_paths, self.n_nodes
+        identity_paths = sp.identity(n_paths, format='csr')
+        identity_nodes = sp.identity(n_nodes, format='csr')
+
+        def zeros(rows, cols):
+            return sp.csr_matrix((rows, cols))
+
+        blocks = [
+            ("Proportion_Refueled", sp.hstack([-identity_paths, params.coverage_matrix(), zeros(n_paths, n_nodes)]),
+             '>', np.zeros(n_paths)),
+            ("Budget_Constraint", sp.hstack([zeros(1, n_paths), sp.csr_matrix(np.full((1, n_nodes), float(VC))),
+                                             sp.csr_matrix(np.full((1, n_nodes), float(FC)))]),
+             '<', np.array([float(B)])),
+            ("Module_Capacity", sp.hstack([zeros(n_nodes, n_paths), identity_nodes, -M * identity_nodes]),
+             '<', np.zeros(n_nodes)),
+            ("Cap on modules at one station", sp.hstack([zeros(n_nodes, n_paths), identity_nodes,
+                                                         zeros(n_nodes, n_nodes)]),
+             '<', np.full(n_nodes, float(CAP))),
+        ]
+        if min_service is not None:
+            blocks.append(("Minimum service ratio", sp.hstack([identity_paths, zeros(n_paths, 2 * n_nodes)]),
+                           '>', np.full(n_paths, float(min_service))))
+
+        # Row range of every named constraint block
+        self.row_blocks = {}
+        start = 0
+        for name, A, _, _ in blocks:
+            self.row_blocks[name] = slice(start, start + A.shape[0])
+            start += A.shape[0]
+
+        self.A = sp.vstack([A for _, A, _, _ in blocks], format='csr')
+        self.sense = np.concatenate([np.full(A.shape[0], sense) for _, A, sense, _ in blocks])
+        self.rhs = np.concatenate([rhs for _, _, _, rhs in blocks])
+
+        self.c = np.concatenate([params.flows, np.zeros(2 * n_nodes)])
+        self.lb = np.zeros(n_paths + 2 * n_nodes)
+        self.ub = np.concatenate([np.ones(n_paths), np.full(n_nodes, np.inf), np.ones(n_nodes)])
+        self.vtype = np.array(['C'] * n_paths + ['I'] * n_nodes + ['B'] * n_nodes)
+
+        self.y = slice(0, n_paths)
+        self.x = slice(n_paths, n_paths + n_nodes)
+        self.z = slice(n_paths + n_nodes, n_paths + 2 * n_nodes)
+
+    @property
+    def budget_row(self):
+        return self.row_blocks["Budget_Constraint"].start
+
+    # Lower and upper row activities (lb <= A v <= ub), the form used by LP/MIP solvers such as HiGHS
+    def row_bounds(self):
+        lower = np.where(self.sense == '<', -np.inf, self.rhs)
+        upper = np.where(self.sense == '>', np.inf, self.rhs)
+        return lower, upper
+
+
+# ---------------------------------------------------Gurobi-------------------------------------------------------------
+
+
+# Builds the formulation with Gurobi's matrix API: three MVars and one addMConstr call per constraint block.
+# Returns the model and the y, x, z MVars
+def build_gurobi_model(formulation, name="OD_Flow_Maximization", time_limit=120):
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    model = gp.Model(name)
+    model.setParam('TimeLimit', time_limit)
+
+    y = model.addMVar(formulation.n_paths, lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS, name="y")
+    x = model.addMVar(formulation.n_nodes, lb=0, vtype=GRB.INTEGER, name="x")
+    z = model.addMVar(formulation.n_nodes, vtype=GRB.BINARY, name="z")
+    variables = gp.hstack((y, x, z))
+
+    model.setMObjective(None, formulation.c, 0.0, xc=variables, sense=GRB.MAXIMIZE)
+
+    for block, rows in formulation.row_blocks.items():
+        constrs = model.addMConstr(formulation.A[rows], variables, formulation.sense[rows],
+                                   formulation.rhs[rows], name=block)
+        if rows.stop - rows.start == 1:
+            constrs.tolist()[0].ConstrName = block  # single rows keep their plain name, e.g. "Budget_Constraint"
+
+    model.update()
+    return model, y, x, z
@@ -1,15 +1,20 @@
-import gurobipy as gp
-from gurobipy import GRB
-import DataGenerationAndProcessing as data
-import DataGenerationAndProcessingExtended as extendData
-import osmnx as ox
-import matplotlib.pyplot as plt
+import time
+import GraphCache
+import SparseParameters
+import MatrixModel
+import ParameterBundle
+import Heuristic
+import Presolve
+import Decomposition
+
+# gurobipy and matplotlib are imported where they are used, so loading a model from a bundle or solving it with HiGHS,
+# the relaxation or the decomposition needs neither of them
 
 
 class Model:  # base model and extended model
 
     def __init__(self, FC, VC, B, CAP, M, Q, K, N_q, f_q, d_k, coords, routes_nodes, routes_length, G,
-                 is_extended=False, N_qp=None, f_qp=None, P=None):
+                 is_extended=False, N_qp=None, f_qp=None, P=None, min_service=None):
         self.FC = FC
         self.VC = VC
         self.B = B
@@ -28,16 +33,22 @@ class Model:  # base model and extended model
         self.is_extended = is_extended
         self.N_qp = N_qp
         self.f_qp = f_qp
+        # The extended model may also be given N_qp / f_qp in place of N_q / f_q (as in Main.py)
+        if is_extended:
+            self.N_qp = N_qp if N_qp is not None else N_q
+            self.f_qp = f_qp if f_qp is not None else f_q
+            self.P = P if P is not None else list(next(iter(self.N_qp.values())).keys())
+        # {node: (x, y)} known without the road graph, e.g. from a parameter bundle
+        self.node_coordinates = {}
+        # Minimum service ratio on every path (extended model default as before, base model without)
+        self.min_service = MatrixModel.min_service_for(min_service, is_extended)
 
     def create_model(self, FC, VC, B, CAP, M, Q, K, N_q, f_q, d_k, coords, routes_nodes, routes_length, G, N_qp=None,
                      f_qp=None, P=None):
+        import gurobipy as gp
+        from gurobipy import GRB
 
         if self.is_extended:
-            coords, routesandpath_nodes, routes_shortestpath_length, G = extendData.get_routesandpaths()
-            annual_trips = data.get_flows(coords, routes_shortestpath_length)
-            Q, P, K, N_qp, f_q, f_qp, d_k = extendData.get_parameters_extended(routesandpath_nodes, annual_trips,
-                                                                               routes_shortestpath_length, G)
-
             for q in Q:  # Iterate through each OD pair in Q
                 for p in f_qp[q]:  # Iterate through each path for the OD pair
                     demand_value = f_qp[q][p]  # Access the demand value for this path
@@ -51,7 +62,9 @@ class Model:  # base model and extended model
         # Decision variables as in mathematical model description
         global x, y, z
         if self.is_extended:
-            y = model.addVars(self.Q, P, lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS, name="y")
+            # (q, p) of every path; OD-pairs may have different numbers of paths (e.g. from ColumnGeneration)
+            paths = [(q, p) for q in Q for p in N_qp[q]]
+            y = model.addVars(paths, lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS, name="y")
         else:
             y = model.addVars(self.Q, lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS, name="y")
         x = model.addVars(self.K, lb=0, vtype=GRB.INTEGER, name="x")
@@ -59,19 +72,19 @@ class Model:  # base model and extended model
 
         # Objective function as in mathematical model description
         if self.is_extended:
-            model.setObjective(gp.quicksum(f_qp[q][p] * y[q, p] for q in Q for p in P), GRB.MAXIMIZE)
+            model.setObjective(gp.quicksum(f_qp[q][p] * y[q, p] for q, p in paths), GRB.MAXIMIZE)
         else:
             model.setObjective(gp.quicksum(self.f_q[od] * y[od] for od in self.Q), GRB.MAXIMIZE)
 
         # Constraints as in mathematical model description
         if self.is_extended:
-            model.addConstrs((gp.quicksum(x[k] / self.d_k[k] for k in N_qp[q][p]) >= y[q, p] for q in Q for p in P),
+            model.addConstrs((gp.quicksum(x[k] / self.d_k[k] for k in N_qp[q][p]) >= y[q, p] for q, p in paths),
                              "Proportion_Refueled")
             model.addConstr(gp.quicksum(z[k] * FC + x[k] * VC for k in K) <= B, "Budget_Constraint")
             model.addConstrs((x[k] <= z[k] * M for k in K), "Module_Capacity")
             model.addConstrs((x[k] <= CAP for k in K), "Cap on modules at one station")
             # Uncomment for minimum service constraint and set value accordingly
-            model.addConstrs((y[q, p] >= 0.4 for q in Q for p in P), "Minimum service ratio for all paths, when total service ratio >= minimum service ratio")
+            model.addConstrs((y[q, p] >= self.min_service for q, p in paths), "Minimum service ratio for all paths, when total service ratio >= minimum service ratio")
 
         else:
             model.addConstrs((gp.quicksum(x[k] / self.d_k[k] for k in self.N_q[od]) >= y[od] for od in self.Q),
@@ -79,13 +92,60 @@ class Model:  # base model and extended model
             model.addConstr(gp.quicksum(z[k] * FC + x[k] * VC for k in K) <= B, "Budget_Constraint")
             model.addConstrs((x[k] <= z[k] * M for k in K), "Module_Capacity")
             model.addConstrs((x[k] <= CAP for k in K), "Cap on modules at one station")
-            # Uncomment for minimum service constraint and set value accordingly
-            #model.addConstrs((y[od] >= 0.5 for od in Q),"Minimum service ratio for all paths, when total service ratio >= minimum service ratio")
+            # Set min_service for minimum service constraint
+            if self.min_service is not None:
+                model.addConstrs((y[od] >= self.min_service for od in self.Q), "Minimum service ratio for all paths, when total service ratio >= minimum service ratio")
+
+        return model
+
+    # Model on a prebuilt (e.g. loaded) parameter bundle, without any data generation
+    @classmethod
+    def from_bundle(cls, bundle, FC, VC, B, CAP, M, min_service=None, G=None):
+        if bundle.is_extended:
+            model = cls(FC, VC, B, CAP, M, bundle.Q, bundle.K, bundle.N_qp, bundle.f_qp, bundle.d_k, None, None, None, G,
+                        True, bundle.N_qp, bundle.f_qp, bundle.P, min_service)
+        else:
+            model = cls(FC, VC, B, CAP, M, bundle.Q, bundle.K, bundle.N_qp, bundle.f_qp, bundle.d_k, None, None, None, G,
+                        False, min_service=min_service)
+        model.node_coordinates = bundle.node_coordinates
+        return model
+
+    def to_bundle(self):
+        if self.is_extended:
+            return ParameterBundle.ParameterBundle.from_extended(self.Q, self.P, self.K, self.N_qp, self.f_qp, self.d_k,
+                                                                 self.G)
+        return ParameterBundle.ParameterBundle.from_base(self.Q, self.K, self.N_q, self.f_q, self.d_k, self.G)
+
+    # Parameters of this model as a sparse path-by-node incidence
+    def sparse_parameters(self):
+        if self.is_extended:
+            return SparseParameters.SparseParameters.from_paths(self.N_qp, self.f_qp, nodes=self.K, d_k=self.d_k)
+        return SparseParameters.SparseParameters.from_routes(self.N_q, self.f_q, nodes=self.K, d_k=self.d_k)
+
+    # Same formulation as create_model, built from sparse matrices with Gurobi's matrix API (addMVar / addMConstr).
+    # With presolve, interchangeable candidate nodes are aggregated first (Presolve.reduce) and x / z only exist for
+    # the kept nodes
+    def create_matrix_model(self, presolve=False):
+        params = self.sparse_parameters()
+        if presolve:
+            reduction = Presolve.reduce(params, min(self.CAP, self.M))
+            print(f"Presolve kept {len(reduction.reduced.nodes)} of {len(params.nodes)} candidate nodes")
+            self.reduction = reduction
+            params = reduction.reduced
+        formulation = MatrixModel.Formulation(params, self.FC, self.VC, self.B, self.CAP, self.M, self.min_service)
+        model, y_mvar, x_mvar, z_mvar = MatrixModel.build_gurobi_model(formulation)
 
+        # Key the variables like the tupledicts of create_model so print_result works for both builders
+        global x, y, z
+        y = dict(zip(params.path_keys, y_mvar.tolist()))
+        x = dict(zip(params.K, x_mvar.tolist()))
+        z = dict(zip(params.K, z_mvar.tolist()))
         return model
 
     def print_result(self, model):
-        P = [1, 2, 3]
+        from gurobipy import GRB
+        import matplotlib.pyplot as plt
+
         result_locations = []
 
         if model.status == GRB.OPTIMAL or model.Status == GRB.TIME_LIMIT:
@@ -94,7 +154,7 @@ class Model:  # base model and extended model
             print("\nCoverage:")
             if self.is_extended:
                 for od in self.Q:
-                    for p in P:
+                    for p in self.N_qp[od]:
                         print(f"{od} path {p}: {round(y[od, p].x, 4) * 100}%")
             else:
                 for od in self.Q:
@@ -103,12 +163,12 @@ class Model:  # base model and extended model
 
             #Uncomment this block for visualizing relative tour coverage (In the case of extended, only for equal flow dist!)
 
-            q_values =12
+            q_values = len(self.Q)
             yq = []
 
             if self.is_extended:
                 for od in self.Q:  # Assuming q_values is the number of OD-tours
-                    yq.append(sum(y[od, p].X for p in P)/3)
+                    yq.append(sum(y[od, p].X for p in self.N_qp[od])/len(self.N_qp[od]))
 
             else:
                 for od in self.Q:
@@ -127,7 +187,7 @@ class Model:  # base model and extended model
 
             # Node output for visualization. Uncomment for visualization
             """
-            for k in self.K:
+            for k in x:
                 if z[k].x == 1:
                     print(f" Node {k}:", round(x[k].x), "modules")
                     node_coords = self.get_node_coordinates(k)
@@ -139,21 +199,66 @@ class Model:  # base model and extended model
 
         self.result_locations = result_locations
 
-    def run(self):
-        if self.is_extended:
+    # Builds the Gurobi model with either builder and keeps its y, x, z variables on the instance. presolve implies the
+    # matrix builder
+    def build(self, use_matrix_api=False, presolve=False):
+        start = time.perf_counter()
+        if use_matrix_api or presolve:
+            model = self.create_matrix_model(presolve)
+        elif self.is_extended:
             model = self.create_model(self.FC, self.VC, self.B, self.CAP, self.M, self.Q, self.K, self.N_q, self.f_q,
                                       self.d_k, self.coord, self.routes_nodes, self.routes_length, self.G, self.N_qp,
                                       self.f_qp, self.P)
         else:
             model = self.create_model(self.FC, self.VC, self.B, self.CAP, self.M, self.Q, self.K, self.N_q, self.f_q,
                                       self.d_k, self.coord, self.routes_nodes, self.routes_length, self.G)
+        model.update()
+        self.build_time = time.perf_counter() - start
+        self.x, self.y, self.z = x, y, z
+        return model
+
+    def run(self, use_matrix_api=False, presolve=False):
+        model = self.build(use_matrix_api, presolve)
+
         model.optimize()
+        self.solve_time = model.Runtime
+        print(f"Model build time: {round(self.build_time, 2)} s, solve time: {round(self.solve_time, 2)} s")
+
         objective = model.objVal
         gap = model.MIPGap
         self.print_result(model)
         return objective, gap
 
+    # Fast mode: LP relaxation of x / z rounded to a budget-feasible plan (Heuristic.solve_relaxed) instead of the MIP.
+    # Returns the objective of the rounded plan and its gap to the LP bound, like run
+    def run_relaxed(self):
+        solution = Heuristic.solve_relaxed(self.sparse_parameters(), self.FC, self.VC, self.B, self.CAP,
+                                           self.min_service)
+        self.relaxed_solution = solution
+        self.solve_time = solution.runtime
+        print(f"Relaxed solve time: {round(solution.runtime, 3)} s, LP bound: {solution.bound}, gap: {solution.gap}")
+        if not solution.feasible:
+            print("The rounded plan does not reach the minimum service ratio on every path")
+        for k, modules in solution.stations().items():
+            print(f" Node {k}:", modules, "modules")
+        return solution.objective, solution.gap
+
+    # Lagrangian decomposition over the connected components of the OD groups (Decomposition.solve), solved on
+    # processes worker processes with the given SolverBackend. Returns the objective of the plan and its gap to the
+    # Lagrangian bound, like run
+    def run_decomposed(self, processes=None, backend="highs", time_limit=120):
+        solution = Decomposition.solve(self.sparse_parameters(), self.FC, self.VC, self.B, self.CAP, self.M,
+                                       self.min_service, processes, backend, time_limit=time_limit)
+        self.decomposed_solution = solution
+        self.solve_time = solution.runtime
+        print(f"Decomposed solve time: {round(solution.runtime, 2)} s, bound: {solution.bound}, gap: {solution.gap}")
+        for k, modules in solution.stations().items():
+            print(f" Node {k}:", modules, "modules")
+        return solution.objective, solution.gap
+
     def get_node_coordinates(self, node_id):
-        G = ox.graph_from_address("Munich, Germany", network_type='drive', dist=5000)
+        if node_id in self.node_coordinates:
+            return self.node_coordinates[node_id]
+        G = self.G if self.G is not None else GraphCache.get_graph("Munich, Germany", dist=5000, network_type='drive')
         x, y = G.nodes[node_id]['x'], G.nodes[node_id]['y']
         return (x, y)
@@ -0,0 +1,102 @@
+import numpy as np
+import SparseParameters
+
+# All model parameters of one instance in a single object that can be written to and read from a compressed .npz
+# file. A bundle built once by the data modules lets every solve (e.g. each budget iteration) skip routing, parking
+# filtering and parameter generation. Base bundles have P = None and use N_qp / f_qp as N_q {q: nodes} / f_q {q: flow}.
+# In extended bundles every OD-pair has its own paths N_qp[q]; P lists all path numbers in use.
+
+
+class ParameterBundle:
+
+    def __init__(self, Q, K, N_qp, f_qp, d_k, P=None, node_coordinates=None):
+        self.Q = list(Q)
+        self.P = list(P) if P is not None else None
+        self.K = list(K)
+        self.N_qp = N_qp
+        self.f_qp = f_qp
+        self.d_k = d_k
+        # {node: (x, y)} of the candidate nodes, so results can be located without loading the road graph
+        self.node_coordinates = node_coordinates or {}
+
+    @property
+    def is_extended(self):
+        return self.P is not None
+
+    @classmethod
+    def from_base(cls, Q, K, N_q, f_q, d_k, G=None):
+        return cls(Q, K, N_q, f_q, {k: d_k[k] for k in K}, None, cls.coordinates_from_graph(G, K))
+
+    @classmethod
+    def from_extended(cls, Q, P, K, N_qp, f_qp, d_k, G=None):
+        return cls(Q, K, N_qp, f_qp, {k: d_k[k] for k in K}, P, cls.coordinates_from_graph(G, K))
+
+    @staticmethod
+    def coordinates_from_graph(G, K):
+        if G is None:
+            return None
+        return {k: (G.nodes[k]['x'], G.nodes[k]['y']) for k in K}
+
+    # Path keys (q or (q, p)) with their node lists and flows, in model order
+    def paths(self):
+        if self.is_extended:
+            keys = [(q, p) for q in self.Q for p in self.N_qp[q]]
+            return keys, [self.N_qp[q][p] for q, p in keys], [self.f_qp[q][p] for q, p in keys]
+        return self.Q, [self.N_qp[q] for q in self.Q], [self.f_qp[q] for q in self.Q]
+
+    def sparse_parameters(self):
+        keys, paths, flows = self.paths()
+        return SparseParameters.SparseParameters(keys, paths, flows, nodes=self.K, d_k=self.d_k)
+
+    # ---------------------------------------------------Files----------------------------------------------------------
+
+    def save(self, path):
+        keys, paths, flows = self.paths()
+        lengths = np.array([len(nodes) for nodes in paths], dtype=np.int64)
+        coordinates = np.array([self.node_coordinates.get(k, (np.nan, np.nan)) for k in self.K], dtype=float)
+        od_index = {q: i for i, q in enumerate(self.Q)}
+        np.savez_compressed(
+            path,
+            Q=np.array(self.Q, dtype=str),
+            P=np.array(self.P if self.is_extended else [], dtype=np.int64),
+            path_od=np.array([od_index[q] for q, _ in keys] if self.is_extended else [], dtype=np.int64),
+            path_ids=np.array([p for _, p in keys] if self.is_extended else [], dtype=np.int64),
+            is_extended=np.array(self.is_extended),
+            K=np.array(self.K, dtype=np.int64),
+            d_k=np.array([self.d_k[k] for k in self.K], dtype=float),
+            path_indptr=np.concatenate([[0], np.cumsum(lengths)]),
+            path_nodes=np.array([node for nodes in paths for node in nodes], dtype=np.int64),
+            flows=np.array(flows, dtype=float),
+            node_coordinates=coordinates.reshape(len(self.K), 2),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            Q = data['Q'].tolist()
+            P = data['P'].tolist() if bool(data['is_extended']) else None
+            K = data['K'].tolist()
+            d_k = dict(zip(K, data['d_k'].tolist()))
+            indptr = data['path_indptr']
+            path_nodes = data['path_nodes']
+            paths = [path_nodes[indptr[r]:indptr[r + 1]].tolist() for r in range(len(indptr) - 1)]
+            flows = data['flows'].tolist()
+            if P is None:
+                keys = None
+            elif 'path_ids' in data:
+                keys = [(Q[i], p) for i, p in zip(data['path_od'].tolist(), data['path_ids'].tolist())]
+            else:
+                # Bundles written before paths could differ per OD-pair have the same P for every q
+                keys = [(q, p) for q in Q for p in P]
+            node_coordinates = {k: (x, y) for k, (x, y) in zip(K, data['node_coordinates'].tolist())
+                                if not np.isnan(x)}
+
+        if P is None:
+            N_qp = dict(zip(Q, paths))
+            f_qp = dict(zip(Q, flows))
+        else:
+            N_qp, f_qp = {}, {}
+            for r, (q, p) in enumerate(keys):
+                N_qp.setdefault(q, {})[p] = paths[r]
+                f_qp.setdefault(q, {})[p] = flows[r]
+        return cls(Q, K, N_qp, f_qp, d_k, P, node_coordinates)
@@ -1,17 +1,14 @@
 # TODO: Build on Kimas visualize_potential_facility_location() and devise specific parking lots
-# Fetch parking data for Munich
-import osmnx as ox
-import networkx as nx
-import matplotlib.pyplot as plt
-from shapely.geometry import Point, LineString
-import geopy.distance
-from DataGenerationAndProcessing import get_routes
+# Fetch parking data for Munich (SpatialIndex, which loads osmnx and geopandas, and geopy are imported where they are
+# used)
 
-# Function to check if a parking lot is within 1km of any route
+# Function to check if a parking lot is within 500m of any route (single lot; filtered_parking_coordinates checks all lots in one batch)
 
 class PotentialLocation:
 
     def is_parking_near_any_route(self, parking_point, routes_coords):
+        import geopy.distance
+
         for route_line in routes_coords.values():
             # Use geopy to calculate distance
             nearest_point = route_line.interpolate(route_line.project(parking_point))
@@ -22,23 +19,17 @@ class PotentialLocation:
         return False
 
 
-    def filtered_parking_coordinates(self, G, routes_nodes):
-        parking = ox.features_from_place("Munich, Germany", tags={'amenity': 'parking'})
-        print(f"Total parking lots: {len(parking)}")
+    def filtered_parking_coordinates(self, G, routes_nodes, radius=500):
+        import SpatialIndex
 
-        routes_coords = {}
-        for route_name, route in routes_nodes.items():
-            route_coords = [Point(G.nodes[node]['x'], G.nodes[node]['y']) for node in route]
-            routes_coords[route_name] = LineString(route_coords)
+        parking = SpatialIndex.get_parking("Munich, Germany")
+        print(f"Total parking lots: {len(parking)}")
 
-        filtered_parking = parking[
-            parking.apply(lambda x: self.is_parking_near_any_route(x.geometry.centroid, routes_coords), axis=1)]
+        # All parking centroids are checked against all buffered routes at once (radius in metres)
+        filtered_parking = parking[SpatialIndex.parking_near_routes(G, routes_nodes, parking, radius)]
         print(f"Filtered parking lots: {len(filtered_parking)}")  # Print filtered parking lots
 
         # Get the coordinates of filtered parking lots
-        filtered_parking_coordinates = [(p.geometry.centroid.y, p.geometry.centroid.x) for p in
-                                        filtered_parking.itertuples()]
+        filtered_parking_coordinates = SpatialIndex.centroid_coordinates(filtered_parking)
 
         return filtered_parking_coordinates
-
-
@@ -0,0 +1,71 @@
+import numpy as np
+
+# Exact candidate-node aggregation. Nodes on exactly the same paths (same column of the incidence matrix, counts
+# included) differ only in d_k: a module at node k adds count / d_k to every one of these paths. With the same FC and
+# VC everywhere, any plan can swap its modules in such a group onto the nodes with the smallest d_k without raising
+# the cost, lowering any coverage or opening more stations. So per group only the nodes with the smallest d_k are kept,
+# as many as it takes to reach full coverage at CAP modules each (coverage beyond 1 is worth nothing). Nodes that add
+# nothing to any path (no paths or d_k <= 0) are dropped. The kept nodes are real nodes, so reduced solutions are
+# already plans on the road graph; groups lists the interchangeable nodes behind every kept one.
+
+
+class Reduction:
+
+    def __init__(self, params, reduced, groups):
+        self.params = params
+        self.reduced = reduced
+        self.groups = groups  # {kept node: [all nodes of its group, by increasing d_k]}
+
+    @property
+    def removed(self):
+        return len(self.params.nodes) - len(self.reduced.nodes)
+
+
+# Hash of every incidence column from two random 64 bit keys per path. Integer sums wrap around identically in any
+# order, so equal columns always get equal hashes; different columns collide with probability ~2^-128
+def column_signatures(incidence, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(np.iinfo(np.int64).min, np.iinfo(np.int64).max, size=(incidence.shape[0], 2), dtype=np.int64)
+    counts = incidence.tocsc().astype(np.int64)
+    counts.sort_indices()
+    columns = np.repeat(np.arange(counts.shape[1]), np.diff(counts.indptr))
+    with np.errstate(over='ignore'):
+        hashes = np.zeros((counts.shape[1], 2), dtype=np.int64)
+        for j in range(2):
+            np.add.at(hashes[:, j], columns, counts.data * keys[counts.indices, j])
+    _, signature = np.unique(hashes, axis=0, return_inverse=True)
+    return signature.ravel()
+
+
+def reduce(params, CAP):
+    incidence = params.incidence.tocsc()
+    demand = params.demand
+    entries = np.diff(incidence.indptr)
+    useful = np.flatnonzero((entries > 0) & (demand > 0))
+    if len(useful) == 0:
+        return Reduction(params, params.select_nodes(useful), {})
+
+    columns = incidence[:, useful]
+    signature = column_signatures(columns)
+    # Lowest count of a node on its paths: full coverage of every path needs sum CAP / d_k >= 1 / lowest count
+    lowest = np.minimum.reduceat(columns.data, columns.indptr[:-1])
+    threshold = 1 / lowest
+
+    order = np.lexsort((demand[useful], signature))
+    group = signature[order]
+    capacity = CAP / demand[useful][order]
+    cumulative = np.cumsum(capacity)
+    group_start = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    offset = np.repeat(cumulative[group_start] - capacity[group_start], np.diff(np.r_[group_start, len(group)]))
+    # A node is kept while the cheaper nodes of its group cannot yet reach full coverage
+    before = cumulative - capacity - offset
+    keep = before < threshold[order] - 1e-12
+
+    kept = np.sort(useful[order][keep])
+    nodes = params.nodes[useful][order]
+    groups = {}
+    for start, end in zip(group_start.tolist(), np.r_[group_start[1:], len(group)].tolist()):
+        members = nodes[start:end].tolist()
+        for node in nodes[start:end][keep[start:end]].tolist():
+            groups[node] = members
+    return Reduction(params, params.select_nodes(kept), groups)
@@ -0,0 +1,279 @@
+import csv
+import itertools
+import os
+from multiprocessing import Pool
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+
+# Shortest-path routing for OD-pairs. Pairs are grouped by origin and each origin is solved with one single-source
+# Dijkstra that yields the paths and the lengths to all of its destinations at once. Two backends: NetworkX on the
+# OSMnx graph (origins run in parallel) and scipy.sparse.csgraph on a CSR copy of it (CsrGraph), which runs
+# many-to-many Dijkstra in compiled code and keeps memory at a few arrays per edge, for metro-wide graphs.
+# Alternative paths per OD-pair (edge-disjoint, k shortest simple paths or penalty-based) are generated on a process
+# pool as well, one task per OD-pair.
+
+
+# OD-pairs of densely populated areas used by the base and the extended model
+OD_PAIRS = [
+    ("Perlach", "Neuhausen"),
+    ("Thalkirchen", "Freimann"),
+    ("Bogenhausen", "Thalkirchen"),
+    ("Bogenhausen", "Neuhausen"),
+    ("Perlach", "Freimann"),
+    ("Hadern", "Stachus"),
+    ("Moosach", "Stachus"),
+    ("Feldmoching", "Odeonsplatz"),
+    ("Oberfoehring", "Odeonsplatz"),
+    ("Berg-am-Laim", "Isartor"),
+    ("Giesing", "Sendlinger-Tor"),
+    ("Sendling", "Sendlinger-Tor"),
+]
+
+
+def od_name(origin, destination):
+    return f"{origin} to {destination}"
+
+
+# Reads OD-pairs from a CSV file with the columns origin,destination
+def load_od_pairs(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['origin'].strip(), row['destination'].strip()) for row in csv.DictReader(f)]
+
+
+# Groups OD-pairs by origin node: {origin_node: {destination_node, ...}}
+def group_by_origin(anchors, od_pairs):
+    targets = {}
+    for origin, destination in od_pairs:
+        targets.setdefault(anchors[origin], set()).add(anchors[destination])
+    return targets
+
+
+# ---------------------------------------------------CSR graph----------------------------------------------------------
+
+
+# The road graph as CSR adjacency matrix. Node ids are kept in a sorted array and mapped to matrix indices with
+# searchsorted. Parallel edges collapse to the lightest one (as NetworkX does for multigraphs), and zero weights
+# become a tiny positive weight, because csgraph drops zeros whenever a matrix is rebuilt
+class CsrGraph:
+
+    zero_weight = 1e-9
+
+    def __init__(self, G, weight='length'):
+        self.weight = weight
+        self.nodes = np.sort(np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes()))
+        edges = list(G.edges(data=weight, default=1.0))
+        u = self.index(np.fromiter((edge[0] for edge in edges), dtype=np.int64, count=len(edges)))
+        v = self.index(np.fromiter((edge[1] for edge in edges), dtype=np.int64, count=len(edges)))
+        w = np.fromiter((edge[2] for edge in edges), dtype=float, count=len(edges))
+        w = np.where(w > 0, w, self.zero_weight)
+
+        # Lightest of all parallel edges: sort by (u, v, w) and keep the first of every (u, v)
+        order = np.lexsort((w, v, u))
+        u, v, w = u[order], v[order], w[order]
+        first = np.r_[True, (u[1:] != u[:-1]) | (v[1:] != v[:-1])]
+        n = len(self.nodes)
+        self.matrix = sp.csr_matrix((w[first], (u[first], v[first])), shape=(n, n))
+
+    # CsrGraph from stored arrays (see LandmarkIndex.save)
+    @classmethod
+    def from_arrays(cls, nodes, indptr, indices, data, weight='length'):
+        csr = cls.__new__(cls)
+        csr.weight = weight
+        csr.nodes = np.asarray(nodes, dtype=np.int64)
+        csr.matrix = sp.csr_matrix((data, indices, indptr), shape=(len(csr.nodes), len(csr.nodes)))
+        return csr
+
+    # Matrix indices of node ids
+    def index(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        idx = np.searchsorted(self.nodes, nodes)
+        if np.any(idx >= len(self.nodes)) or np.any(self.nodes[np.minimum(idx, len(self.nodes) - 1)] != nodes):
+            raise KeyError("Node not in graph")
+        return idx
+
+    # Node ids of a path from the predecessor row of its source, None if the target is unreachable
+    def path(self, predecessors, source, target):
+        path = [target]
+        while target != source:
+            target = predecessors[target]
+            if target < 0:
+                return None
+            path.append(target)
+        return self.nodes[path[::-1]].tolist()
+
+    # Shortest paths from every origin to its targets ({origin: {target, ...}} of node ids): {origin: {target:
+    # (path, length)}}. Origins are solved chunk_size at a time, so at most chunk_size distance rows are held at once
+    def shortest_paths(self, targets, chunk_size=64):
+        origins = list(targets)
+        results = {}
+        for start in range(0, len(origins), chunk_size):
+            chunk = origins[start:start + chunk_size]
+            distances, predecessors = dijkstra(self.matrix, directed=True, indices=self.index(chunk),
+                                               return_predecessors=True)
+            for row, origin in enumerate(chunk):
+                source = self.index([origin])[0]
+                results[origin] = {}
+                for target in targets[origin]:
+                    t = self.index([target])[0]
+                    if np.isfinite(distances[row, t]):
+                        results[origin][target] = (self.path(predecessors[row], source, t), float(distances[row, t]))
+        return results
+
+
+# ---------------------------------------------------Workers------------------------------------------------------------
+
+
+# Graph shared by the worker processes (inherited on fork, sent once per worker otherwise)
+_worker_graph = None
+
+
+def _init_worker(G):
+    global _worker_graph
+    _worker_graph = G
+
+
+def _dijkstra_targets(G, origin, targets, weight):
+    lengths, paths = nx.single_source_dijkstra(G, origin, weight=weight)
+    return {target: (paths[target], lengths[target]) for target in targets if target in lengths}
+
+
+def _route_origin(args):
+    origin, targets, weight = args
+    return origin, _dijkstra_targets(_worker_graph, origin, targets, weight)
+
+
+# ---------------------------------------------------Routing------------------------------------------------------------
+
+
+ROUTING_BACKENDS = ["networkx", "csgraph"]
+
+
+# Shortest paths and lengths for all OD-pairs. anchors maps location names to graph nodes. Returns the same
+# routes_nodes / routes_length dicts get_routes always produced, keyed "<origin> to <destination>". backend is
+# "networkx", "csgraph" or a prebuilt routing index with a shortest_paths(targets) method (CsrGraph or
+# LandmarkIndex), built once and reused across calls
+def route_od_pairs(G, anchors, od_pairs=OD_PAIRS, weight='length', processes=None, backend="networkx"):
+    if isinstance(backend, str) and backend not in ROUTING_BACKENDS:
+        raise ValueError(f"Unknown routing backend '{backend}', choose from {ROUTING_BACKENDS} or pass a routing index")
+    targets = group_by_origin(anchors, od_pairs)
+    tasks = [(origin, origin_targets, weight) for origin, origin_targets in targets.items()]
+
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    if backend == "csgraph":
+        results = CsrGraph(G, weight).shortest_paths(targets)
+    elif not isinstance(backend, str):
+        results = backend.shortest_paths(targets)
+    elif processes > 1:
+        with Pool(processes, initializer=_init_worker, initargs=(G,)) as pool:
+            results = dict(pool.imap_unordered(_route_origin, tasks))
+    else:
+        results = {origin: _dijkstra_targets(G, origin, origin_targets, weight)
+                   for origin, origin_targets, _ in tasks}
+
+    routes_nodes = {}
+    routes_length = {}
+    for origin, destination in od_pairs:
+        source, target = anchors[origin], anchors[destination]
+        if target not in results[source]:
+            raise nx.NetworkXNoPath(f"No path between {origin} and {destination}.")
+        path, length = results[source][target]
+        routes_nodes[od_name(origin, destination)] = path
+        routes_length[od_name(origin, destination)] = length
+
+    return routes_nodes, routes_length
+
+
+# ---------------------------------------------------Alternative paths--------------------------------------------------
+
+
+ALTERNATIVE_PATH_ALGORITHMS = ["edge_disjoint", "k_shortest", "penalty"]
+
+# Simple DiGraph of the worker graph (lightest of parallel edges), built once per worker for k_shortest
+_worker_simple_graph = None
+
+
+def simple_graph(G, weight='length'):
+    if not G.is_multigraph():
+        return G
+    D = nx.DiGraph()
+    D.add_nodes_from(G.nodes)
+    for u, v, w in G.edges(data=weight, default=1.0):
+        if not D.has_edge(u, v) or w < D[u][v][weight]:
+            D.add_edge(u, v, **{weight: w})
+    return D
+
+
+def edge_disjoint_paths(G, origin, destination, k, weight='length'):
+    return list(nx.edge_disjoint_paths(G, origin, destination, cutoff=k))
+
+
+# Yen's k shortest loopless paths
+def k_shortest_paths(G, origin, destination, k, weight='length'):
+    return list(itertools.islice(nx.shortest_simple_paths(G, origin, destination, weight=weight), k))
+
+
+# Shortest path, then again with the weights of all edges used so far multiplied by penalty, until k different paths
+# are found or max_attempts searches ran
+def penalty_paths(G, origin, destination, k, weight='length', penalty=1.5, max_attempts=None):
+    factors = {}
+
+    def penalised(u, v, edges):
+        length = min(data.get(weight, 1) for data in edges.values()) if G.is_multigraph() else edges.get(weight, 1)
+        return length * factors.get((u, v), 1.0)
+
+    paths = []
+    for _ in range(max_attempts or 3 * k):
+        path = nx.dijkstra_path(G, origin, destination, weight=penalised)
+        if path not in paths:
+            paths.append(path)
+            if len(paths) == k:
+                break
+        for edge in zip(path[:-1], path[1:]):
+            factors[edge] = factors.get(edge, 1.0) * penalty
+    return paths
+
+
+def _alternative_paths(G, origin, destination, k, algorithm, weight, penalty):
+    if algorithm == "edge_disjoint":
+        paths = edge_disjoint_paths(G, origin, destination, k, weight)
+    elif algorithm == "k_shortest":
+        global _worker_simple_graph
+        if _worker_simple_graph is None or _worker_simple_graph[0] is not G:
+            _worker_simple_graph = (G, simple_graph(G, weight))
+        paths = k_shortest_paths(_worker_simple_graph[1], origin, destination, k, weight)
+    elif algorithm == "penalty":
+        paths = penalty_paths(G, origin, destination, k, weight, penalty)
+    else:
+        raise ValueError(f"Unknown algorithm '{algorithm}', choose from {ALTERNATIVE_PATH_ALGORITHMS}")
+    return paths, [nx.path_weight(G, path, weight) for path in paths]
+
+
+def _route_alternatives(args):
+    name, origin, destination, k, algorithm, weight, penalty = args
+    return name, _alternative_paths(_worker_graph, origin, destination, k, algorithm, weight, penalty)
+
+
+# Up to k alternative paths for every OD-pair with the chosen algorithm ("edge_disjoint" as nx.edge_disjoint_paths
+# with cutoff=k, "k_shortest" for Yen's k shortest simple paths, "penalty" for penalty-based alternatives). OD-pairs
+# run in parallel on a process pool that shares the graph. Returns routes_paths {q: [nodes, ...]} and
+# routes_lengths {q: [metres, ...]}, keyed "<origin> to <destination>" in the order of od_pairs
+def alternative_paths(G, anchors, od_pairs=OD_PAIRS, k=3, algorithm="edge_disjoint", weight='length', penalty=1.5,
+                      processes=None):
+    if algorithm not in ALTERNATIVE_PATH_ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}', choose from {ALTERNATIVE_PATH_ALGORITHMS}")
+    tasks = [(od_name(origin, destination), anchors[origin], anchors[destination], k, algorithm, weight, penalty)
+             for origin, destination in od_pairs]
+
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    if processes > 1:
+        with Pool(processes, initializer=_init_worker, initargs=(G,)) as pool:
+            results = dict(pool.imap_unordered(_route_alternatives, tasks))
+    else:
+        results = {name: _alternative_paths(G, origin, destination, k, algorithm, weight, penalty)
+                   for name, origin, destination, k, algorithm, weight, penalty in tasks}
+
+    routes_paths = {name: results[name][0] for name, *_ in tasks}
+    routes_lengths = {name: results[name][1] for name, *_ in tasks}
+    return routes_paths, routes_lengths
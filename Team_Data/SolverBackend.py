@@ -0,0 +1,158 @@
+import time
+import numpy as np
+import MatrixModel
+import Presolve
+
+# Solver backends for the sparse MatrixModel.Formulation. Both read the same matrices, so a formulation built once can
+# be solved by Gurobi (matrix API) or by the open-source HiGHS MILP solver through scipy.optimize.milp. gurobipy is
+# imported only inside GurobiBackend, so HiGHS runs work on machines without a Gurobi installation or licence.
+# The TSP models and the XX example scripts stay on gurobipy.
+
+
+class Result:
+
+    def __init__(self, backend, formulation, values, objective, bound, status, build_time, solve_time):
+        self.backend = backend
+        self.formulation = formulation
+        self.values = values  # [y | x | z] of the best solution, None if no solution was found
+        self.objective = objective
+        self.bound = bound
+        self.status = status  # "optimal", "time_limit", "infeasible" or "other"
+        self.build_time = build_time
+        self.solve_time = solve_time
+
+    @property
+    def gap(self):
+        if self.values is None:
+            return float('nan')
+        return abs(self.bound - self.objective) / max(abs(self.objective), 1e-10)
+
+    # {k: modules} of all opened stations
+    def stations(self):
+        if self.values is None:
+            return {}
+        nodes = self.formulation.params.nodes.tolist()
+        x, z = self.values[self.formulation.x], self.values[self.formulation.z]
+        return {k: int(round(modules)) for k, modules, opened in zip(nodes, x, z) if opened > 0.5}
+
+
+class GurobiBackend:
+    name = "gurobi"
+
+    def __init__(self, threads=None, output=True):
+        self.threads = threads
+        self.output = output
+
+    def solve(self, formulation, time_limit=120, mip_gap=None):
+        start = time.perf_counter()
+        model, y, x, z = MatrixModel.build_gurobi_model(formulation, time_limit=time_limit)
+        build_time = time.perf_counter() - start
+
+        model.setParam('OutputFlag', int(self.output))
+        if self.threads is not None:
+            model.setParam('Threads', self.threads)
+        if mip_gap is not None:
+            model.setParam('MIPGap', mip_gap)
+        model.optimize()
+
+        status = gurobi_status(model)
+        if model.SolCount == 0:
+            return Result(self.name, formulation, None, float('nan'), float('nan'), status, build_time, model.Runtime)
+        values = np.concatenate([y.X, x.X, z.X])
+        return Result(self.name, formulation, values, model.ObjVal, model.ObjBound, status, build_time, model.Runtime)
+
+
+# Status of a solved Gurobi model as in Result.status, so both backends report the same values
+def gurobi_status(model):
+    from gurobipy import GRB
+
+    if model.Status == GRB.OPTIMAL:
+        return "optimal"
+    if model.Status == GRB.TIME_LIMIT:
+        return "time_limit"
+    if model.Status in (GRB.INFEASIBLE, GRB.INF_OR_UNBD):
+        return "infeasible"
+    return "other"
+
+
+class HighsBackend:
+    name = "highs"
+
+    def __init__(self, output=False):
+        self.output = output
+
+    def solve(self, formulation, time_limit=120, mip_gap=None):
+        from scipy.optimize import milp, Bounds, LinearConstraint
+
+        start = time.perf_counter()
+        lower, upper = formulation.row_bounds()
+        constraints = LinearConstraint(formulation.A, lower, upper)
+        integrality = (formulation.vtype != 'C').astype(int)
+        bounds = Bounds(formulation.lb, formulation.ub)
+        options = {"time_limit": time_limit, "disp": self.output}
+        if mip_gap is not None:
+            options["mip_rel_gap"] = mip_gap
+        build_time = time.perf_counter() - start
+
+        # milp minimises, the model maximises the covered flow
+        start = time.perf_counter()
+        result = milp(-formulation.c, integrality=integrality, bounds=bounds, constraints=constraints, options=options)
+        solve_time = time.perf_counter() - start
+
+        status = {0: "optimal", 1: "time_limit", 2: "infeasible"}.get(result.status, "other")
+        if result.x is None:
+            return Result(self.name, formulation, None, float('nan'), float('nan'), status, build_time, solve_time)
+        bound = -result.mip_dual_bound if result.mip_dual_bound is not None else -result.fun
+        return Result(self.name, formulation, result.x, -result.fun, bound, status, build_time, solve_time)
+
+
+BACKENDS = {"gurobi": GurobiBackend, "highs": HighsBackend}
+
+
+# Backend instance from a name ("gurobi", "highs") or an existing backend
+def get_backend(backend, **options):
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown solver backend '{backend}', choose from {list(BACKENDS)}")
+        return BACKENDS[backend](**options)
+    return backend
+
+
+# Formulation of a parameter bundle (ParameterBundle.ParameterBundle) for the given costs, budget and caps, on the
+# candidate nodes kept by Presolve.reduce if presolve is set. min_service=None is the model default, as in Model
+def formulation(bundle, FC, VC, B, CAP, M, min_service=None, presolve=False):
+    params = bundle.sparse_parameters()
+    if presolve:
+        params = Presolve.reduce(params, min(CAP, M)).reduced
+    min_service = MatrixModel.min_service_for(min_service, bundle.is_extended)
+    return MatrixModel.Formulation(params, FC, VC, B, CAP, M, min_service)
+
+
+# ---------------------------------------------------Benchmark----------------------------------------------------------
+
+
+# Solves every formulation in instances ({name: formulation}) with every backend and returns build time, solve time,
+# objective, bound and gap per instance and backend
+def benchmark(instances, backends=("gurobi", "highs"), time_limit=120, mip_gap=None):
+    import pandas as pd
+
+    rows = []
+    for name, instance in instances.items():
+        for backend in backends:
+            backend = get_backend(backend, output=False)
+            result = backend.solve(instance, time_limit, mip_gap)
+            rows.append({
+                "instance": name,
+                "backend": backend.name,
+                "paths": instance.n_paths,
+                "nodes": instance.n_nodes,
+                "build_time": result.build_time,
+                "solve_time": result.solve_time,
+                "objective": result.objective,
+                "bound": result.bound,
+                "gap": result.gap,
+                "status": result.status,
+            })
+            print(f"{name} / {backend.name}: objective {result.objective}, gap {result.gap}, "
+                  f"build {round(result.build_time, 3)} s, solve {round(result.solve_time, 2)} s")
+    return pd.DataFrame(rows)
@@ -0,0 +1,104 @@
+from itertools import chain
+import numpy as np
+import scipy.sparse as sp
+import FlowGeneration
+
+# Compact model parameters: a path-by-node incidence matrix in CSR format, one flow value per path and an array-backed
+# node index. Path keys are OD-pairs q (base model) or (q, p) tuples (extended model). Only nodes that lie on a path
+# are indexed, so memory grows with the route nodes and not with the size of the road graph.
+
+
+class SparseParameters:
+
+    # paths: list of node lists, flows: flow per path, nodes: optional node order (defaults to sorted unique nodes),
+    # d_k: optional {node: demand} that replaces the computed demand (e.g. the dicts of get_parameters_extended)
+    def __init__(self, path_keys, paths, flows, nodes=None, d_k=None):
+        self.path_keys = list(path_keys)
+        self.flows = np.asarray(flows, dtype=float)
+
+        lengths = np.array([len(path) for path in paths], dtype=np.int64)
+        flat = np.fromiter(chain.from_iterable(paths), dtype=np.int64, count=int(lengths.sum()))
+        if nodes is None:
+            self.nodes, cols = np.unique(flat, return_inverse=True)
+        else:
+            self.nodes = np.asarray(nodes, dtype=np.int64)
+            order = np.argsort(self.nodes)
+            positions = np.minimum(np.searchsorted(self.nodes, flat, sorter=order), max(len(order) - 1, 0))
+            cols = order[positions] if len(order) else positions
+            missing = flat[self.nodes[cols] != flat] if len(order) else flat
+            if len(missing):
+                raise KeyError(f"Path node {missing[0]} is not in nodes ({len(np.unique(missing))} path nodes missing)")
+        self.node_index = {node: i for i, node in enumerate(self.nodes.tolist())}
+
+        # Entry (r, i) counts how often node i lies on path r
+        rows = np.repeat(np.arange(len(self.path_keys)), lengths)
+        self.incidence = sp.csr_matrix((np.ones(len(flat)), (rows, cols)),
+                                       shape=(len(self.path_keys), len(self.nodes)))
+        self.incidence.sum_duplicates()
+
+        # Summed demand on node k based on all flows: one sparse matrix-vector product
+        if d_k is None:
+            self.demand = self.incidence.T @ self.flows
+        else:
+            self.demand = np.array([d_k[node] for node in self.nodes.tolist()], dtype=float)
+
+    # Base model: routes_nodes {q: nodes}, f_q {q: flow}
+    @classmethod
+    def from_routes(cls, N_q, f_q, nodes=None, d_k=None):
+        Q = list(N_q.keys())
+        return cls(Q, [N_q[q] for q in Q], [f_q[q] for q in Q], nodes, d_k)
+
+    # Extended model: N_qp {q: {p: nodes}}, f_qp {q: {p: flow}}
+    @classmethod
+    def from_paths(cls, N_qp, f_qp, nodes=None, d_k=None):
+        path_keys = [(q, p) for q in N_qp for p in N_qp[q]]
+        return cls(path_keys, [N_qp[q][p] for q, p in path_keys], [f_qp[q][p] for q, p in path_keys], nodes, d_k)
+
+    # Zone system: od_pairs is a list of (origin_zone, destination_zone) indices into the OD flow matrix (e.g. a memory
+    # map from FlowGeneration.od_flow_matrix), paths the node list of each pair. Flows are gathered straight from the
+    # matrix and converted to charging flows, without building per-pair dicts
+    @classmethod
+    def from_od_matrix(cls, od_pairs, paths, matrix, nodes=None, flow=FlowGeneration.charging_flow):
+        origins = [origin for origin, _ in od_pairs]
+        destinations = [destination for _, destination in od_pairs]
+        flows = FlowGeneration.gather_flows(matrix, origins, destinations)
+        return cls(od_pairs, paths, flow(flows) if flow else flows, nodes)
+
+    @property
+    def K(self):
+        return self.nodes.tolist()
+
+    def d_k(self):
+        return dict(zip(self.nodes.tolist(), self.demand.tolist()))
+
+    def path_nodes(self, r):
+        start, end = self.incidence.indptr[r], self.incidence.indptr[r + 1]
+        return self.nodes[self.incidence.indices[start:end]].tolist()
+
+    # Same paths and flows restricted to the given node columns (index array or boolean mask)
+    def select_nodes(self, columns):
+        selected = SparseParameters.__new__(SparseParameters)
+        selected.path_keys = self.path_keys
+        selected.flows = self.flows
+        selected.nodes = self.nodes[columns]
+        selected.node_index = {node: i for i, node in enumerate(selected.nodes.tolist())}
+        selected.incidence = self.incidence[:, columns].tocsr()
+        selected.demand = self.demand[columns]
+        return selected
+
+    # The given paths (index array or boolean mask) on the same nodes
+    def select_paths(self, rows):
+        selected = SparseParameters.__new__(SparseParameters)
+        selected.path_keys = [self.path_keys[r] for r in np.arange(len(self.path_keys))[rows].tolist()]
+        selected.flows = self.flows[rows]
+        selected.nodes = self.nodes
+        selected.node_index = self.node_index
+        selected.incidence = self.incidence[rows].tocsr()
+        selected.demand = self.demand
+        return selected
+
+    # Coefficient matrix of the Proportion_Refueled rows: entry (r, k) = (times k lies on path r) / d_k
+    def coverage_matrix(self):
+        with np.errstate(divide='ignore'):
+            inverse_demand = np.where(self.demand != 0, 1 / self.demand, 0.0)
+        return (self.incidence @ sp.diags(inverse_demand)).tocsr()
@@ -0,0 +1,141 @@
+import time
+import numpy as np
+import geopandas as gpd
+from scipy.spatial import cKDTree
+from shapely import STRtree
+from shapely.geometry import Point, LineString
+
+# Bulk spatial queries between road-graph nodes, routes and parking lots. All distances are evaluated in a
+# projected metric CRS (the local UTM zone), so thresholds are true metres instead of degrees.
+
+
+# ---------------------------------------------------Parking data-------------------------------------------------------
+
+
+# Parking features already fetched in this process, so repeated map and filter calls share one download
+_parking_features = {}
+
+
+# All OSM parking features of a place
+def get_parking(place="Munich, Germany"):
+    if place not in _parking_features:
+        import osmnx as ox
+        _parking_features[place] = ox.features_from_place(place, tags={'amenity': 'parking'})
+    return _parking_features[place]
+
+
+# Public parking lots (surface or street side) of a place as centroid points
+def get_parking_centroids(place="Munich, Germany"):
+    parking = get_parking(place)
+    parking_locations = parking[(parking['access'] == 'yes') & (parking['parking'].isin(['surface', 'street_side']))]
+    parking_locations = parking_locations.to_crs(parking_locations.estimate_utm_crs())
+    return gpd.GeoDataFrame(geometry=parking_locations.centroid)
+
+
+# (lat, lon) of the feature centroids, computed in metric space and converted back to the features' CRS
+def centroid_coordinates(features):
+    if features.empty:
+        return []
+    centroids = features.geometry.to_crs(features.estimate_utm_crs()).centroid.to_crs(features.crs)
+    return [(p.y, p.x) for p in centroids]
+
+
+# ---------------------------------------------------Node filters-------------------------------------------------------
+
+
+def nodes_gdf(G, nodes):
+    nodes = list(dict.fromkeys(nodes))  # unique, order preserving
+    xs = [G.nodes[node]['x'] for node in nodes]
+    ys = [G.nodes[node]['y'] for node in nodes]
+    return gpd.GeoDataFrame(geometry=gpd.points_from_xy(xs, ys), index=nodes, crs=G.graph.get('crs', 'EPSG:4326'))
+
+
+# Set of nodes that lie within max_distance metres of any parking centroid, found in one nearest-neighbour join
+def nodes_near_parking(G, nodes, parking_gdf, max_distance=300):
+    nodes_points = nodes_gdf(G, nodes)
+    metric_crs = nodes_points.estimate_utm_crs()
+    joined = gpd.sjoin_nearest(nodes_points.to_crs(metric_crs), parking_gdf.to_crs(metric_crs), how='inner',
+                               max_distance=max_distance)
+    return set(joined.index)
+
+
+# Keeps only path nodes close to a public parking lot; paths that end up empty and OD-pairs without any path are
+# dropped, exactly like the former per-node loop in get_routesandpaths
+def filter_paths_by_parking(G, routesandpath_nodes, parking_gdf, max_distance=300):
+    start = time.perf_counter()
+    nodes_list = [node for path_list in routesandpath_nodes for path in path_list for node in path]
+    nodes_with_parking = nodes_near_parking(G, nodes_list, parking_gdf, max_distance)
+
+    filtered_routesandpath_nodes = []
+    for path_list in routesandpath_nodes:
+        filtered_od_pair_paths = []
+        for path in path_list:
+            filtered_path = [node for node in path if node in nodes_with_parking]
+            if filtered_path:
+                filtered_od_pair_paths.append(filtered_path)
+        if filtered_od_pair_paths:
+            filtered_routesandpath_nodes.append(filtered_od_pair_paths)
+
+    elapsed = time.perf_counter() - start
+    print(f"Parking filter: {len(nodes_with_parking)} of {len(set(nodes_list))} path nodes within {max_distance} m "
+          f"of {len(parking_gdf)} parking lots ({elapsed:.3f} s)")
+    return filtered_routesandpath_nodes
+
+
+# KD-tree over the graph nodes with at least min_edges in-/outgoing edges, built once and queried for all points in
+# one call. Coordinates are projected to local metres (equirectangular), which is exact enough at city scale
+class CrossingIndex:
+
+    earth_radius = 6371008.8
+
+    def __init__(self, G, min_edges=6):
+        self.min_edges = min_edges
+        self.nodes = np.array([node for node, degree in G.degree if degree >= min_edges])
+        if len(self.nodes) == 0:
+            raise ValueError(f"Graph has no node with at least {min_edges} in-/outgoing edges")
+        lats = np.array([G.nodes[node]['y'] for node in self.nodes])
+        lons = np.array([G.nodes[node]['x'] for node in self.nodes])
+        self.reference_lat = np.radians(lats.mean())
+        self.tree = cKDTree(self.to_metres(lats, lons))
+
+    def to_metres(self, lats, lons):
+        lats, lons = np.radians(lats), np.radians(lons)
+        return np.column_stack((self.earth_radius * lons * np.cos(self.reference_lat), self.earth_radius * lats))
+
+    # Nearest qualifying node and its distance in metres for arrays of latitudes and longitudes
+    def query(self, lats, lons):
+        distances, idx = self.tree.query(self.to_metres(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)))
+        return self.nodes[idx], distances
+
+
+# Nearest crossing node (degree >= min_edges) for every named (lat, lon) point: {name: node}
+def nearest_crossings(G, coords, min_edges=6):
+    names = list(coords.keys())
+    nodes, _ = CrossingIndex(G, min_edges).query([coords[name][0] for name in names],
+                                                 [coords[name][1] for name in names])
+    return dict(zip(names, nodes.tolist()))
+
+
+# ---------------------------------------------------Route filters------------------------------------------------------
+
+
+def routes_gdf(G, routes_nodes):
+    geometries = []
+    for route in routes_nodes.values():
+        points = [Point(G.nodes[node]['x'], G.nodes[node]['y']) for node in route]
+        geometries.append(LineString(points) if len(points) > 1 else points[0])
+    return gpd.GeoDataFrame(geometry=geometries, index=list(routes_nodes.keys()), crs=G.graph.get('crs', 'EPSG:4326'))
+
+
+# Boolean mask over the parking features: True where the centroid lies within radius metres of any route. All routes
+# are buffered once and every centroid is tested against an STRtree of the buffers in a single bulk query
+def parking_near_routes(G, routes_nodes, parking, radius=500):
+    metric_crs = parking.estimate_utm_crs()
+    centroids = parking.geometry.to_crs(metric_crs).centroid
+    route_buffers = routes_gdf(G, routes_nodes).to_crs(metric_crs).buffer(radius)
+
+    tree = STRtree(route_buffers.values)
+    parking_idx, _ = tree.query(centroids.values, predicate='intersects')
+    mask = np.zeros(len(parking), dtype=bool)
+    mask[parking_idx] = True
+    return mask
@@ -0,0 +1,286 @@
+import csv
+import heapq
+import itertools
+import math
+import os
+import time
+from multiprocessing import Pool
+import pandas as pd
+import MatrixModel
+import ParameterBundle
+import SolverBackend
+
+# Budget sweeps on a single Gurobi model. The model is built once; between steps only the right-hand side of
+# Budget_Constraint changes and the previous solution is passed in as MIP start. For increasing budgets the previous
+# plan stays feasible, so every solve after the first starts from a good incumbent.
+# gurobipy (and Model, which builds on it) is imported only on the Gurobi paths, so scenario grids can run with the
+# HiGHS backend on machines without Gurobi.
+
+
+# Values of all variables of the last solve, used as start of the next one
+def incumbent(gp_model):
+    if gp_model.SolCount == 0:
+        return None
+    variables = gp_model.getVars()
+    return variables, gp_model.getAttr('X', variables)
+
+
+def set_start(gp_model, start):
+    if start is not None:
+        variables, values = start
+        gp_model.setAttr('Start', variables, values)
+
+
+def stations(model):
+    return {k: round(model.x[k].X) for k in model.x if model.z[k].X > 0.5}
+
+
+# Solves the built gp_model of model at budget B from the given MIP start and returns the result row and the plan
+def solve_budget(model, gp_model, B, start=None):
+    from gurobipy import GRB
+
+    gp_model.getConstrByName("Budget_Constraint").RHS = B
+    model.B = B
+    set_start(gp_model, start)
+    gp_model.optimize()
+
+    solved = gp_model.SolCount > 0
+    plan = stations(model) if solved else {}
+    row = {
+        "budget": B,
+        "objective": gp_model.ObjVal if solved else float('nan'),
+        "gap": gp_model.MIPGap if solved else float('nan'),
+        "runtime": gp_model.Runtime,
+        "status": SolverBackend.gurobi_status(gp_model),
+        "optimal": gp_model.Status == GRB.OPTIMAL,
+        "stations": len(plan),
+        "modules": sum(plan.values()),
+    }
+    print(f"BUDGET {B}: objective {row['objective']}, gap {row['gap']}, runtime {round(gp_model.Runtime, 2)} s")
+    return row, plan
+
+
+# Solves model (a Model.Model) for every budget in budgets and returns one row per budget with objective, gap,
+# runtime and the number of stations and modules
+def budget_sweep(model, budgets, use_matrix_api=True, time_limit=120, warm_start=True, presolve=False):
+    gp_model = model.build(use_matrix_api, presolve)
+    gp_model.setParam('TimeLimit', time_limit)
+
+    results = []
+    for B in budgets:
+        start = incumbent(gp_model) if warm_start else None
+        row, _ = solve_budget(model, gp_model, B, start)
+        results.append(row)
+
+    return pd.DataFrame(results)
+
+
+# Coverage-vs-budget curve between B_min and B_max with adaptively placed budgets. The midpoint (on the min_step grid)
+# of an interval is solved and both halves are refined further only while it deviates from the linear interpolation
+# between the interval ends by more than tolerance times the total rise; an interval whose objective rises by at most
+# that much is never sampled (the curve never decreases, so nothing in between can deviate more). Intervals are refined
+# in order of their rise, a changed station set breaking ties, until max_solves is reached. Each solve starts from the
+# plan of the nearest smaller solved budget, which is always feasible. If B_min has no solution (e.g. the minimum
+# service is not reachable), the first budget with a solution is found by bisection and the curve starts there; a
+# B_max without a solution raises a ValueError. The returned DataFrame is sorted by budget and its attrs hold the
+# number of solves and how many a uniform min_step grid would have needed
+def budget_frontier(model, B_min, B_max, min_step=1000, tolerance=0.01, use_matrix_api=True, time_limit=120,
+                    presolve=False, max_solves=None):
+    gp_model = model.build(use_matrix_api, presolve)
+    gp_model.setParam('TimeLimit', time_limit)
+
+    rows, plans, starts = {}, {}, {}
+
+    def solve(B):
+        smaller = [b for b in starts if b <= B]
+        rows[B], plans[B] = solve_budget(model, gp_model, B, starts[max(smaller)] if smaller else None)
+        start = incumbent(gp_model)
+        if start is not None:
+            starts[B] = start
+        return not math.isnan(rows[B]["objective"])
+
+    solved_min = solve(B_min)
+    if not solve(B_max):
+        raise ValueError(f"No solution at the largest budget {B_max} (status {rows[B_max]['status']}), the "
+                         f"frontier needs a solved upper end")
+    # A larger budget keeps every plan feasible: bisect between the last budget without and the first with a solution
+    first = B_min
+    if not solved_min:
+        low, first = B_min, B_max
+        while first - low > min_step:
+            middle = low + max(1, round((first - low) / (2 * min_step))) * min_step
+            if middle >= first:
+                break
+            if solve(middle):
+                first = middle
+            else:
+                low = middle
+        print(f"Budget frontier: no solution below {first}")
+    total_rise = abs(rows[B_max]["objective"] - rows[first]["objective"]) or 1.0
+
+    def objective(B):
+        return rows[B]["objective"]
+
+    # Heap of intervals, the largest rise first and among equal rises those whose station set changes
+    intervals = []
+
+    def add_interval(low, high):
+        if high - low <= min_step:
+            return
+        rise = abs(objective(high) - objective(low)) / total_rise
+        if rise <= tolerance:
+            return
+        heapq.heappush(intervals, (-rise, set(plans[low]) == set(plans[high]), low, high))
+
+    add_interval(first, B_max)
+    while intervals and (max_solves is None or len(rows) < max_solves):
+        _, _, low, high = heapq.heappop(intervals)
+        middle = low + max(1, round((high - low) / (2 * min_step))) * min_step
+        if middle >= high:
+            continue
+        solve(middle)
+        interpolated = objective(low) + (objective(high) - objective(low)) * (middle - low) / (high - low)
+        if abs(objective(middle) - interpolated) / total_rise <= tolerance:
+            continue
+        add_interval(low, middle)
+        add_interval(middle, high)
+
+    results = pd.DataFrame([rows[B] for B in sorted(rows)])
+    uniform_solves = int((B_max - B_min) // min_step) + 1
+    results.attrs.update(solves=len(rows), uniform_solves=uniform_solves, saved_solves=uniform_solves - len(rows))
+    print(f"Budget frontier: {len(rows)} solves instead of {uniform_solves} for a uniform grid with step {min_step} "
+          f"({uniform_solves - len(rows)} saved)")
+    return results
+
+
+# ---------------------------------------------------Scenario grids-----------------------------------------------------
+
+
+# Parameters a scenario may set; everything else comes from the shared parameter bundle
+SCENARIO_PARAMETERS = ["B", "CAP", "FC", "VC", "min_service"]
+
+
+# All combinations of the given values: [{"B": ..., "CAP": ..., "FC": ..., "VC": ..., "min_service": ...}, ...].
+# min_service None is the model default (0.4 for the extended model) and 0 no minimum service, on every backend
+def scenario_grid(B, CAP, FC, VC, min_service=(None,)):
+    return [dict(zip(SCENARIO_PARAMETERS, values)) for values in itertools.product(B, CAP, FC, VC, min_service)]
+
+
+def scenario_key(scenario, is_extended=False):
+    key = []
+    for parameter in SCENARIO_PARAMETERS:
+        value = scenario.get(parameter)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            value = None
+        # The minimum service the model actually uses, so None and the extended default 0.4 are the same scenario
+        if parameter == "min_service":
+            value = MatrixModel.min_service_for(value, is_extended)
+        key.append(None if value is None else float(value))
+    return tuple(key)
+
+
+# Scenarios already written to the output file of an earlier (possibly interrupted) run
+def completed_scenarios(output_path, is_extended=False):
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return set()
+    return {scenario_key(row, is_extended) for row in pd.read_csv(output_path).to_dict("records")}
+
+
+# State of a worker process: the bundle is loaded once per worker and shared by all of its scenarios
+_worker_state = {}
+
+
+def _init_scenario_worker(bundle_path, M, threads, time_limit, use_matrix_api, backend):
+    _worker_state.update(bundle=ParameterBundle.ParameterBundle.load(bundle_path), M=M, threads=threads,
+                         time_limit=time_limit, use_matrix_api=use_matrix_api, backend=backend)
+
+
+def _solve_scenario(scenario):
+    # Rows store the minimum service the model uses, not None for the default
+    scenario = dict(scenario, min_service=MatrixModel.min_service_for(scenario.get("min_service"),
+                                                                      _worker_state["bundle"].is_extended))
+    if _worker_state["backend"] != "gurobi":
+        return _solve_scenario_with_backend(scenario)
+
+    import Model
+    state = _worker_state
+    model = Model.Model.from_bundle(state["bundle"], scenario["FC"], scenario["VC"], scenario["B"], scenario["CAP"],
+                                    state["M"], scenario.get("min_service"))
+    gp_model = model.build(state["use_matrix_api"])
+    gp_model.setParam('OutputFlag', 0)
+    gp_model.setParam('Threads', state["threads"])
+    gp_model.setParam('TimeLimit', state["time_limit"])
+    gp_model.optimize()
+
+    solved = gp_model.SolCount > 0
+    plan = stations(model) if solved else {}
+    return dict(scenario, **{
+        "objective": gp_model.ObjVal if solved else float('nan'),
+        "gap": gp_model.MIPGap if solved else float('nan'),
+        "build_time": model.build_time,
+        "runtime": gp_model.Runtime,
+        "status": SolverBackend.gurobi_status(gp_model),
+        "stations": len(plan),
+        "modules": sum(plan.values()),
+    })
+
+
+# Same row from a SolverBackend (e.g. HiGHS) on the sparse formulation of the bundle
+def _solve_scenario_with_backend(scenario):
+    state = _worker_state
+    start = time.perf_counter()
+    formulation = SolverBackend.formulation(state["bundle"], scenario["FC"], scenario["VC"], scenario["B"],
+                                            scenario["CAP"], state["M"], scenario.get("min_service"))
+    build_time = time.perf_counter() - start
+    result = SolverBackend.get_backend(state["backend"]).solve(formulation, state["time_limit"])
+    plan = result.stations()
+    return dict(scenario, **{
+        "objective": result.objective,
+        "gap": result.gap,
+        "build_time": build_time + result.build_time,
+        "runtime": result.solve_time,
+        "status": result.status,
+        "stations": len(plan),
+        "modules": sum(plan.values()),
+    })
+
+
+# Solves every scenario on a process pool. Each worker loads the bundle at bundle_path once and gets an equal share of
+# total_threads solver threads. Rows are appended to the CSV at output_path as soon as a scenario finishes, and
+# scenarios already in that file are skipped, so an interrupted run resumes where it stopped. Returns all rows as a
+# DataFrame and, if parquet_path is given, also writes them as Parquet. backend selects the solver ("gurobi" or "highs")
+def run_scenarios(bundle_path, scenarios, output_path="scenarios.csv", processes=None, total_threads=None,
+                  time_limit=120, M=999999, use_matrix_api=True, parquet_path=None, backend="gurobi"):
+    is_extended = ParameterBundle.ParameterBundle.load(bundle_path).is_extended
+    done = completed_scenarios(output_path, is_extended)
+    # Scenarios that resolve to the same model (e.g. min_service None and 0.4 on an extended bundle) are solved once
+    todo = []
+    for scenario in scenarios:
+        key = scenario_key(scenario, is_extended)
+        if key not in done:
+            done.add(key)
+            todo.append(scenario)
+    print(f"{len(scenarios) - len(todo)} of {len(scenarios)} scenarios already in {output_path} or repeated")
+
+    processes = max(1, min(processes or os.cpu_count() or 1, len(todo)))
+    threads = max(1, (total_threads or os.cpu_count() or 1) // processes)
+    columns = SCENARIO_PARAMETERS + ["objective", "gap", "build_time", "runtime", "status", "stations", "modules"]
+
+    if todo:
+        write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        with open(output_path, "a", newline='') as f, \
+                Pool(processes, initializer=_init_scenario_worker,
+                     initargs=(bundle_path, M, threads, time_limit, use_matrix_api, backend)) as pool:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            if write_header:
+                writer.writeheader()
+            for i, row in enumerate(pool.imap_unordered(_solve_scenario, todo), 1):
+                writer.writerow(row)
+                f.flush()
+                print(f"Scenario {i}/{len(todo)}: {[row[p] for p in SCENARIO_PARAMETERS]} -> "
+                      f"objective {row['objective']}, gap {row['gap']}")
+
+    results = pd.read_csv(output_path)
+    if parquet_path is not None:
+        results.to_parquet(parquet_path, index=False)
+    return results
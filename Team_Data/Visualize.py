@@ -1,14 +1,31 @@
-import osmnx as ox
-import matplotlib.pyplot as plt
-import PotentialLocation
 import numpy as np
 
+# Maps are drawn by MapRenderer: the edge geometry of a graph is collected once and shared by all maps of that graph,
+# and routes and points are drawn in one call each. Without path a map is shown with pyplot, with path it is rendered
+# headless (Agg) straight into that image file. matplotlib and the parking lookup (PotentialLocation) are imported only
+# when a map is drawn
+
+
 class Visualize:
 
     def __init__(self, result_location=None):
         self.result_location = result_location
 
-    def paths(self, G, routes_nodes):
+    # Shows the overlay (keyword arguments of MapRenderer.draw) on the map of G, or writes it to path
+    def show(self, G, path=None, node_size=15, dpi=150, **overlay):
+        import MapRenderer
+
+        renderer = MapRenderer.get_renderer(G, node_size=node_size, dpi=dpi)
+        if path is not None:
+            return renderer.render(path, **overlay)
+
+        import matplotlib.pyplot as plt
+        figure, ax, artists = renderer.draw(headless=False, **overlay)
+        plt.show()
+        for artist in artists:  # the figure with the network is kept for the next map
+            artist.remove()
+
+    def paths(self, G, routes_nodes, path=None):
         flattened_routes = [node for route in routes_nodes for node in route]
 
         route_colors = []
@@ -19,16 +36,14 @@ class Visualize:
             color_index = i // 3
             route_colors.extend([color_groups[color_index]] * len(route))
 
-        fig, path = ox.plot_graph_routes(G, flattened_routes, route_colors=route_colors, route_linewidth=6, node_size=8)
-        plt.show()
+        return self.show(G, path, node_size=8, routes=flattened_routes, route_colors=route_colors, route_linewidth=6)
 
-    def where_to_install(self, G):
-        fig, location = ox.plot_graph(G, figsize=(12, 12), show=False, close=False)
-        for (x, y) in self.result_location:
-            location.scatter(x, y, c='red', s=100, alpha=0.7, zorder=5)
-        plt.show()
+    def where_to_install(self, G, path=None, dpi=150):
+        return self.show(G, path, dpi=dpi, points=self.result_location, point_size=100)
 
-    def base_model_map(self, G, routes_nodes):
+    # parking_coords are (lat, lon) of the parking lots near the routes, e.g. from an earlier
+    # PotentialLocation.filtered_parking_coordinates call; without them the parking lots are fetched and filtered
+    def base_model_map(self, G, routes_nodes, parking_coords=None, path=None):
 
         # Extract the route lists from the routes dictionary for plotting
         route_lists = list(routes_nodes.values())
@@ -38,34 +53,24 @@ class Visualize:
         route_colors = route_colors[:len(route_lists)]  # Trim the list to the length of route_lists
 
         # Plot filtered parking lots
-        potential_location = PotentialLocation.PotentialLocation()
-        parking_coords = potential_location.filtered_parking_coordinates(G, routes_nodes)
+        if parking_coords is None:
+            import PotentialLocation
+            potential_location = PotentialLocation.PotentialLocation()
+            parking_coords = potential_location.filtered_parking_coordinates(G, routes_nodes)
         print(len(parking_coords))
 
+        # Plot the graph, the routes and the parking lots
+        return self.show(G, path, node_size=10, routes=route_lists, route_colors=route_colors, route_linewidth=6,
+                         points=[(x, y) for y, x in parking_coords], point_size=20)
 
-        # Plot the graph and routes
-        fig, ax = ox.plot_graph_routes(G, route_lists, route_colors=route_colors, route_linewidth=6, node_size=10, figsize=(12, 12), show=False, close=False)
-        #fig, ax = ox.plot_graph(G, figsize=(12, 12), show=False, close=False)
-
-        for y, x in parking_coords:
-            ax.scatter(x, y, c='red', s=20, alpha=0.7, zorder=5)  # Increase the size for visibility
-
-        plt.show()
-
-    def location(self, G, routes_nodes):
-
-        # Extract the route lists from the routes dictionary for plotting
+    def location(self, G, routes_nodes, parking_coords=None, path=None):
 
         # Plot filtered parking lots
-        potential_location = PotentialLocation.PotentialLocation()
-        parking_coords = potential_location.filtered_parking_coordinates(G, routes_nodes)
+        if parking_coords is None:
+            import PotentialLocation
+            potential_location = PotentialLocation.PotentialLocation()
+            parking_coords = potential_location.filtered_parking_coordinates(G, routes_nodes)
         print(len(parking_coords))
 
-
-        # Plot the graph and routes
-        #fig, ax = ox.plot_graph_routes(G, route_lists, route_colors=route_colors, route_linewidth=6, node_size=10, figsize=(12, 12), show=False, close=False)
-        fig, ax = ox.plot_graph(G, figsize=(12, 12), show=False, close=False)
-        for y, x in parking_coords:
-            ax.scatter(x, y, c='red', s=20, alpha=0.7, zorder=5)  # Increase the size for visibility
-        plt.show()
-
+        # Plot the graph and the parking lots
+        return self.show(G, path, points=[(x, y) for y, x in parking_coords], point_size=20)
@@ -0,0 +1,35 @@
+import os
+import sys
+import pytest
+
+# The modules of Team_Data are imported flat, as Main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# A small synthetic grid with the shortest paths {q: nodes} and their lengths {q: metres}
+@pytest.fixture(scope="session")
+def synthetic_routes():
+    import Benchmark
+    import Routing
+
+    instance = Benchmark.SyntheticInstance(400, 6, 3, "grid")
+    routes_nodes, routes_length = Routing.route_od_pairs(instance.G, instance.anchors, instance.od_pairs, processes=1)
+    return instance, routes_nodes, routes_length
+
+
+# Parameters of the extended model on the synthetic grid: (Q, P, K, N_qp, f_q, f_qp, d_k), routes_length and G
+@pytest.fixture(scope="session")
+def extended_instance(synthetic_routes):
+    import Benchmark
+    import Routing
+    import SpatialIndex
+
+    instance, _, routes_length = synthetic_routes
+    routes_paths, _ = Routing.alternative_paths(instance.G, instance.anchors, instance.od_pairs, k=instance.paths,
+                                                processes=1)
+    routesandpath_nodes = [routes_paths[Routing.od_name(origin, destination)]
+                           for origin, destination in instance.od_pairs]
+    routesandpath_nodes = SpatialIndex.filter_paths_by_parking(instance.G, routesandpath_nodes, instance.parking,
+                                                               max_distance=300)
+    parameters = Benchmark._parameters_extended(instance, routesandpath_nodes, routes_length)
+    return parameters, routes_length, instance.G
@@ -0,0 +1,19 @@
+import pytest
+import ColumnGeneration
+import DataGenerationAndProcessing as data
+
+
+def test_priced_path_improves_lp(synthetic_routes):
+    instance, routes_nodes, routes_length = synthetic_routes
+    annual_trips = data.get_flows(instance.coords, routes_length)
+    _, _, _, f_q, _ = data.get_parameters(routes_nodes, instance.G, annual_trips)
+    # A budget that cannot serve every OD-pair on its shortest path
+    paths = ColumnGeneration.ColumnGeneration(instance.G, routes_nodes, routes_length, f_q, 21, 20, 100, 6)
+    N_qp, f_qp = paths.run(rounds=5)
+
+    assert paths.history[-1]["paths"] > paths.history[0]["paths"]
+    assert paths.history[-1]["lp_objective"] > paths.history[0]["lp_objective"] + 1e-6
+    # Every OD-pair keeps its whole flow, split over the paths the LP uses
+    for q in f_q:
+        assert sum(f_qp[q].values()) == pytest.approx(f_q[q])
+        assert set(N_qp[q]) == set(f_qp[q])
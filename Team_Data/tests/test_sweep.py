@@ -0,0 +1,24 @@
+import contextlib
+import io
+import pytest
+
+pytest.importorskip("gurobipy")
+
+import Model
+import Sweep
+
+
+def frontier(extended_instance, tolerance):
+    (Q, P, K, N_qp, f_q, f_qp, d_k), routes_length, G = extended_instance
+    charging_model = Model.Model(21, 20, 100, 6, 999999, Q, K, N_qp, f_qp, d_k, {}, {}, routes_length, G, True, N_qp,
+                                 f_qp, P)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Sweep.budget_frontier(charging_model, 0, 1600, min_step=50, tolerance=tolerance, time_limit=20)
+
+
+def test_looser_tolerance_needs_fewer_solves(extended_instance):
+    tight = frontier(extended_instance, 0.01)
+    loose = frontier(extended_instance, 0.2)
+    assert loose.attrs["solves"] < tight.attrs["solves"] < tight.attrs["uniform_solves"]
+    # Both curves end at the same plateau
+    assert loose["objective"].iloc[-1] == pytest.approx(tight["objective"].iloc[-1], rel=1e-3)